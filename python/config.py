@@ -12,6 +12,9 @@ class Config:
         
         self.config_path = Path(config_path)
         self.config = self._load_config()
+        
+        # Callables notified after every change, so consumers never need to poll
+        self._listeners = []
     
     def _load_config(self):
         """Load configuration from file or create default if not exists."""
@@ -73,20 +76,52 @@ class Config:
     
     def set(self, key, value):
         """Set a configuration value using dot notation."""
-        keys = key.split('.')
-        config = self.config
-        
-        # Navigate to the parent of the target key
-        for k in keys[:-1]:
-            if k not in config:
-                config[k] = {}
-            config = config[k]
-        
-        # Set the value
-        config[keys[-1]] = value
+        self.set_many({key: value})
+    
+    def set_many(self, values):
+        """Set several configuration values using dot notation, saving the file only once."""
+        for key, value in values.items():
+            keys = key.split('.')
+            config = self.config
+            
+            # Navigate to the parent of the target key
+            for k in keys[:-1]:
+                if k not in config:
+                    config[k] = {}
+                config = config[k]
+            
+            # Set the value
+            config[keys[-1]] = value
         
         # Save the updated configuration
         self._save_config(self.config)
+        self._notify_listeners()
+    
+    def reset_defaults(self, section=None):
+        """
+        Restore the default settings of one section (e.g. 'watermark'), or of
+        every section if None, saving the file only once.
+        
+        Returns:
+            The restored defaults: the section's settings, or the whole configuration
+        """
+        defaults = self._get_default_config()
+        sections = defaults if section is None else {section: defaults[section]}
+        self.set_many({
+            f"{name}.{key}": value
+            for name, values in sections.items()
+            for key, value in values.items()
+        })
+        return defaults if section is None else defaults[section]
+    
+    def register_listener(self, listener):
+        """Register a callable to be invoked with no arguments whenever the configuration changes."""
+        self._listeners.append(listener)
+    
+    def _notify_listeners(self):
+        """Notify all registered listeners that the configuration changed."""
+        for listener in self._listeners:
+            listener()
     
     def get_watermark_config(self):
         """Get watermark configuration."""
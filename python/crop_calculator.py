@@ -81,7 +81,7 @@ class CropCalculator:
         Calculate optimal crop window based on detected objects and saliency.
         
         Args:
-            objects: List of detected/tracked objects
+            objects: List or dict of detected/tracked objects, or a DetectionsBatch
             frame_width: Width of the original frame
             frame_height: Height of the original frame
             frame: Optional original frame for additional analysis (face detection, saliency, etc.)
@@ -89,9 +89,13 @@ class CropCalculator:
         Returns:
             Crop window as [x, y, width, height]
         """
-        # Ensure objects is a list
+        # Ensure objects is a list; a DetectionsBatch also brings its boxes as an array
+        boxes = None
         if isinstance(objects, dict):
             objects = list(objects.values())
+        elif hasattr(objects, 'bboxes'):
+            boxes = objects.bboxes.astype(np.float64)
+            objects = list(objects)
         elif not isinstance(objects, list):
             objects = []
         
@@ -136,31 +140,30 @@ class CropCalculator:
                 return self.prev_crop_window
             return self._get_center_crop(frame_width, frame_height)
         
-        # Calculate importance for each object
-        for obj in objects:
-            obj['importance'] = self._calculate_importance(obj, frame_width, frame_height)
-        
-        # Sort objects by importance (descending)
-        sorted_objects = sorted(objects, key=lambda x: x['importance'], reverse=True)
+        # Score every object in one vectorized pass over an (N, 4) box array
+        if objects:
+            if boxes is None or len(boxes) != len(objects):
+                boxes = np.array([obj['box'] for obj in objects], dtype=np.float64).reshape(-1, 4)
+            importance = self._calculate_importance(objects, boxes, frame_width, frame_height)
+            for obj, score in zip(objects, importance.tolist()):
+                obj['importance'] = score
+            centers = boxes[:, :2] + boxes[:, 2:] / 2
         
         # Calculate weighted center of attention from objects
-        if sorted_objects:
+        if objects:
             if self.weighted_center:
-                total_weight = sum(obj['importance'] for obj in sorted_objects)
-                weighted_x = sum(self._get_center_x(obj['box']) * obj['importance'] for obj in sorted_objects) / total_weight
-                weighted_y = sum(self._get_center_y(obj['box']) * obj['importance'] for obj in sorted_objects) / total_weight
+                weighted_x, weighted_y = (importance @ centers / importance.sum()).tolist()
             else:
-                weighted_x = self._get_center_x(obj['box'])
-                weighted_y = self._get_center_y(obj['box'])
+                weighted_x, weighted_y = centers[-1].tolist()
         else:
             # If no objects but we have saliency
             weighted_x, weighted_y = saliency_center or (frame_width / 2, frame_height / 2)
         
         # If we have both objects and saliency, blend them
-        if sorted_objects and saliency_center and self.blend_saliency:
+        if objects and saliency_center and self.blend_saliency:
             saliency_x, saliency_y = saliency_center
             # Blend based on number and importance of objects
-            if len(sorted_objects) <= 2:
+            if len(objects) <= 2:
                 # With few objects, give more weight to saliency
                 blend_factor = 0.3
                 weighted_x = weighted_x * (1 - blend_factor) + saliency_x * blend_factor
@@ -276,39 +279,40 @@ class CropCalculator:
         
         return (center_x, center_y)
     
-    def _calculate_importance(self, obj, frame_width, frame_height):
-        """Calculate importance score for an object with enhanced metrics."""
-        box = obj['box']
-        class_name = obj.get('class_name', 'default')
-        confidence = obj.get('confidence', 1.0)
+    def _calculate_importance(self, objects, boxes, frame_width, frame_height):
+        """Calculate importance scores for all objects at once.
         
-        # Get class weight
-        class_weight = self.class_weights.get(class_name, self.class_weights['default'])
+        Args:
+            objects: List of detected/tracked objects
+            boxes: (N, 4) float array of the objects' [x, y, width, height] boxes
+            frame_width: Width of the original frame
+            frame_height: Height of the original frame
+            
+        Returns:
+            (N,) array of importance scores, in the same order as objects
+        """
+        default_weight = self.class_weights['default']
+        class_weight = np.array(
+            [self.class_weights.get(obj.get('class_name', 'default'), default_weight) for obj in objects],
+            dtype=np.float64,
+        )
+        confidence = np.array([obj.get('confidence', 1.0) for obj in objects], dtype=np.float64)
         
         # Calculate size factor (normalized by frame area)
-        size = box[2] * box[3]
-        frame_area = frame_width * frame_height
-        size_factor = size / frame_area
-        
-        # Calculate center proximity factor
-        center_x = frame_width / 2
-        center_y = frame_height / 2
-        obj_center_x = self._get_center_x(box)
-        obj_center_y = self._get_center_y(box)
+        size_factor = boxes[:, 2] * boxes[:, 3] / (frame_width * frame_height)
         
-        # Normalize distance to frame center
-        max_distance = np.sqrt((frame_width/2)**2 + (frame_height/2)**2)
-        distance = np.sqrt((center_x - obj_center_x)**2 + (center_y - obj_center_y)**2)
-        center_factor = 1 - (distance / max_distance)
+        # Normalize distance of each box center to the frame center
+        offset_x = boxes[:, 0] + boxes[:, 2] / 2 - frame_width / 2
+        offset_y = boxes[:, 1] + boxes[:, 3] / 2 - frame_height / 2
+        max_distance = np.hypot(frame_width / 2, frame_height / 2)
+        center_factor = 1 - np.hypot(offset_x, offset_y) / max_distance
         
         # Combine factors with higher weight for class and size
-        importance = (
+        return (
             class_weight * 1.5 *  # Increase class weight influence
-            confidence * 
+            confidence *
             (self.size_weight * size_factor * 1.2 + self.center_weight * center_factor)
         )
-        
-        return importance
     
     def _smooth_transition(self, prev_crop, current_crop):
         """Apply smoothing between consecutive crop windows."""
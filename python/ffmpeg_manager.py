@@ -8,10 +8,45 @@ import tarfile
 import shutil
 from pathlib import Path
 import hashlib
+import functools
+
+# Downloads are streamed to disk in chunks of this size, never held in memory whole
+DOWNLOAD_CHUNK_SIZE = 128 * 1024
+
+# Official ffmpeg.org-linked static builds, keyed by (platform.system(),
+# platform.machine().lower()); the same CPU is reported as e.g. 'AMD64' or 'x86_64'
+_MACOS_URL = "https://evermeet.cx/ffmpeg/ffmpeg-6.1.1.zip"
+_WINDOWS_URL = "https://www.gyan.dev/ffmpeg/builds/ffmpeg-release-essentials.zip"
+_LINUX_AMD64_URL = "https://johnvansickle.com/ffmpeg/releases/ffmpeg-release-amd64-static.tar.xz"
+_LINUX_ARM64_URL = "https://johnvansickle.com/ffmpeg/releases/ffmpeg-release-arm64-static.tar.xz"
+_DOWNLOAD_URLS = {
+    # https://evermeet.cx/ffmpeg/, runs on arm64 via Rosetta
+    ('Darwin', 'x86_64'): _MACOS_URL,
+    ('Darwin', 'arm64'): _MACOS_URL,
+    # https://www.gyan.dev/ffmpeg/builds/, runs on ARM64 via emulation
+    ('Windows', 'amd64'): _WINDOWS_URL,
+    ('Windows', 'x86_64'): _WINDOWS_URL,
+    ('Windows', 'arm64'): _WINDOWS_URL,
+    # https://johnvansickle.com/ffmpeg/
+    ('Linux', 'x86_64'): _LINUX_AMD64_URL,
+    ('Linux', 'amd64'): _LINUX_AMD64_URL,
+    ('Linux', 'aarch64'): _LINUX_ARM64_URL,
+    ('Linux', 'arm64'): _LINUX_ARM64_URL,
+}
 
 class FFmpegManager:
-    def __init__(self):
-        self.ffmpeg_dir = self._get_ffmpeg_dir()
+    def __init__(self, ffmpeg_dir=None):
+        """
+        Args:
+            ffmpeg_dir: Existing directory to install ffmpeg into, e.g. a shared
+                cache; defaults to the app's own ffmpeg directory
+        """
+        if ffmpeg_dir is None:
+            self.ffmpeg_dir = self._get_ffmpeg_dir()
+        elif Path(ffmpeg_dir).is_dir():
+            self.ffmpeg_dir = Path(ffmpeg_dir)
+        else:
+            raise ValueError(f"Invalid ffmpeg_dir: {ffmpeg_dir}")
         self.ffmpeg_path = self._get_ffmpeg_path()
         
     def _get_ffmpeg_dir(self):
@@ -38,20 +73,10 @@ class FFmpegManager:
         """Get the appropriate ffmpeg download URL for the current platform (official ffmpeg.org builds)."""
         system = platform.system()
         machine = platform.machine().lower()
-
-        # Official ffmpeg.org builds
-        if system == 'Darwin':  # macOS
-            # Official builds are universal (arm64 + x86_64) as of 2024
-            # https://evermeet.cx/ffmpeg/ is linked from ffmpeg.org for macOS static builds
-            return "https://evermeet.cx/ffmpeg/ffmpeg-6.1.1.zip"
-        elif system == 'Windows':
-            # Official builds: https://www.gyan.dev/ffmpeg/builds/ (linked from ffmpeg.org)
-            return "https://www.gyan.dev/ffmpeg/builds/ffmpeg-release-essentials.zip"
-        elif system == 'Linux':
-            # Official static builds: https://johnvansickle.com/ffmpeg/ (linked from ffmpeg.org)
-            return "https://johnvansickle.com/ffmpeg/releases/ffmpeg-release-amd64-static.tar.xz"
-        else:
-            raise RuntimeError(f"Unsupported platform: {system} {machine}")
+        try:
+            return _DOWNLOAD_URLS[(system, machine)]
+        except KeyError:
+            raise RuntimeError(f"Unsupported platform: {system} {machine}") from None
     
     def _download_file(self, url, filepath):
         """Download a file from URL to filepath."""
@@ -60,24 +85,37 @@ class FFmpegManager:
             headers = {'User-Agent': 'Mozilla/5.0'}
             req = urllib.request.Request(url, headers=headers)
             with urllib.request.urlopen(req) as response:
-                with open(filepath, 'wb') as f:
-                    shutil.copyfileobj(response, f)
+                with open(filepath, 'wb', buffering=1 << 20) as f:
+                    shutil.copyfileobj(response, f, DOWNLOAD_CHUNK_SIZE)
             print("Download completed successfully!")
         except Exception as e:
             print(f"Download failed: {e}")
             raise
     
-    def _extract_archive(self, archive_path, extract_to):
-        """Extract downloaded archive."""
-        print(f"Extracting {archive_path} to {extract_to}...")
-        if archive_path.suffix == '.zip':
-            with zipfile.ZipFile(archive_path, 'r') as zip_ref:
+    def _extract_archive(self, archive, extract_to):
+        """
+        Extract downloaded archive.
+        
+        Args:
+            archive: Path to the archive, or a seekable binary file object
+                (e.g. io.BytesIO); either is read incrementally, never whole
+            extract_to: Directory to extract into
+        """
+        print(f"Extracting {archive} to {extract_to}...")
+        if zipfile.is_zipfile(archive):
+            with zipfile.ZipFile(archive, 'r') as zip_ref:
                 zip_ref.extractall(extract_to)
-        elif archive_path.suffix in ['.xz', '.tar', '.tar.xz', '.tar.gz']:
-            with tarfile.open(archive_path, 'r:*') as tar_ref:
-                tar_ref.extractall(extract_to)
         else:
-            raise ValueError(f"Unsupported archive format: {archive_path.suffix}")
+            try:
+                if hasattr(archive, 'read'):
+                    archive.seek(0)
+                    tar_ref = tarfile.open(fileobj=archive, mode='r:*')
+                else:
+                    tar_ref = tarfile.open(archive, 'r:*')
+            except tarfile.ReadError:
+                raise ValueError(f"Unsupported archive format: {archive}") from None
+            with tar_ref:
+                tar_ref.extractall(extract_to)
         print("Extraction completed!")
     
     def _find_ffmpeg_in_extracted(self, extract_dir):
@@ -157,8 +195,14 @@ class FFmpegManager:
 # Global instance
 _ffmpeg_manager = None
 
+@functools.lru_cache(maxsize=None)
 def get_ffmpeg_path():
-    """Get the path to ffmpeg, installing it if necessary."""
+    """
+    Get the path to ffmpeg, installing it if necessary.
+    
+    The result is cached for the life of the process, so the `ffmpeg -version`
+    probe only runs once. Call get_ffmpeg_path.cache_clear() to probe again.
+    """
     global _ffmpeg_manager
     if _ffmpeg_manager is None:
         _ffmpeg_manager = FFmpegManager()
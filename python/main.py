@@ -1,24 +1,43 @@
 import argparse
 import os
 import time
-import cv2
-import numpy as np
 from concurrent.futures import ThreadPoolExecutor
-from video_processor import VideoProcessor
-from object_detector import ObjectDetector
-from object_tracker import ObjectTracker
-from crop_calculator import CropCalculator
-from smoothing import CropWindowSmoother
 from config import config
 
+# Pipeline components pull in OpenCV, PyTorch and Ultralytics, which take
+# a long time to import. They are loaded by _import_pipeline() on first use,
+# so `--help` and importing this module stay fast. Names that are already
+# set (e.g. patched by tests) are left alone.
+VideoProcessor = None
+ObjectDetector = None
+ObjectTracker = None
+CropCalculator = None
+CropWindowSmoother = None
 
 
+def _import_pipeline():
+    """Import the heavy pipeline components that haven't been loaded yet."""
+    global VideoProcessor, ObjectDetector, ObjectTracker, CropCalculator, CropWindowSmoother
+    if VideoProcessor is None:
+        from video_processor import VideoProcessor
+    if ObjectDetector is None:
+        from object_detector import ObjectDetector
+    if ObjectTracker is None:
+        from object_tracker import ObjectTracker
+    if CropCalculator is None:
+        from crop_calculator import CropCalculator
+    if CropWindowSmoother is None:
+        from smoothing import CropWindowSmoother
 
 
 
 
 
-def parse_args():
+
+
+
+def _build_parser():
+    """Build the command line parser; done once at import time."""
     parser = argparse.ArgumentParser(description='Content-aware video cropping')
 
     # Main args
@@ -33,6 +52,8 @@ def parse_args():
     parser.add_argument('--conf_threshold', type=float, default=0.5, help='Confidence threshold for detections')
     parser.add_argument('--model_size', type=str, default='n', choices=['n', 's', 'm', 'l', 'x'], help='YOLOv8 model size (n=nano, s=small, m=medium, l=large, x=xlarge)')
     parser.add_argument('--object_classes', type=int, nargs='+', default=[0], help='List of object class IDs to track. E.g., 0 1 4 (Default is [0] = person)')
+    parser.add_argument('--batch_size', type=int, default=8, help='Number of keyframes passed to the detector in one inference call (Default 8)')
+    parser.add_argument('--detect_stride', type=int, default=1, help='Run the detector on every nth keyframe and track boxes in between (Default 1 = detect on all keyframes)')
 
     # Tracker args
     parser.add_argument('--track_count', type=int, default=1, help='Number of objects to track in frame (Default 1)')
@@ -64,37 +85,62 @@ def parse_args():
     parser.add_argument('--watermark_opacity', type=float, default=None, help='Watermark opacity (0.0 to 1.0)')
 
 
-    return parser.parse_args()
+    return parser
 
 
+_PARSER = _build_parser()
 
 
+def parse_args(argv=None):
+    """Parse command line arguments (sys.argv[1:] if argv is None)."""
+    return _PARSER.parse_args(argv)
 
-def process_keyframe(frame_idx, frame, detector, tracker, tracked_objects_by_frame, track_count=1):
-    """Process a keyframe with detection and tracking."""
-    # print(f"🐤 main : process_keyframe: {frame_idx}")
 
-    # Detect objects in frame
-    detected_objects = detector.detect(
-        frame,              # 🕵️‍♂️ Detect objects in the frame
-        top_n=track_count,  # 🏷️ Get the top N detection (highest confidence) 
-    )
+
+
+
+def process_keyframes(frame_indices, frames, detector, tracker, tracked_objects_by_frame, track_count=1, detect_stride=1):
+    """
+    Process a batch of keyframes: detect objects in all of them with a single
+    detector call, then update the tracker frame by frame, in order.
+    
+    With detect_stride > 1 the detector only runs on every detect_stride-th
+    keyframe of the batch and its boxes are tracked across the others.
+    
+    Returns:
+        The frame indices that were processed
+    """
+    if detect_stride > 1:
+        detections_per_frame = list(detector.detect_stream(frames, stride=detect_stride, top_n=track_count))
+    else:
+        detections_per_frame = detector.detect_batch(frames, top_n=track_count)
     
-    # Update tracker with new detections
-    tracked_objects = tracker.update(frame, detected_objects)
-    tracked_objects_by_frame[frame_idx] = tracked_objects
+    for frame_idx, frame, detected_objects in zip(frame_indices, frames, detections_per_frame):
+        tracked_objects_by_frame[frame_idx] = tracker.update(frame, detected_objects)
     
-    return frame_idx
+    return frame_indices
 
 
 
 
 
-def main(args=None):
+def main(args=None, detector=None):
+    """
+    Run the reframing pipeline.
+    
+    Args:
+        args: Parsed command line arguments (parsed from sys.argv if None)
+        detector: Optional ready-made ObjectDetector to reuse instead of loading
+            a new model, e.g. one shared across runs
+    """
 
     if args is None:
         args = parse_args()
     
+    import numpy as np
+    _import_pipeline()
+    from object_detector import _chunks
+    
     # Debug output to verify parameters
     print(f"DEBUG: Debug mode enabled: {args.debug}")
     print(f"DEBUG: Current working directory: {os.getcwd()}")
@@ -118,13 +164,15 @@ def main(args=None):
     video_processor = VideoProcessor()
 
 
-    detector = ObjectDetector(
-        confidence_threshold=args.conf_threshold,   # 🕵️‍♂️ Confidence threshold for object detection (0-1).
-        model_size=args.model_size,                # 📏 Size of the YOLOv8 model (n=small, s=medium, m=large, l=xlarge).
-        classes=args.object_classes,               # 🏷️ Classes to detect (0=person, 1=bicycle, 4=car, 7=truck, etc...).
-        debug=args.debug,                               # 🐛 If True, saves debug images and logs to help you visualize decisions.
-        input_video_path=args.input,               # 📁 Path to input video (for debug log location)
-    )
+    if detector is None:
+        detector = ObjectDetector(
+            confidence_threshold=args.conf_threshold,   # 🕵️‍♂️ Confidence threshold for object detection (0-1).
+            model_size=args.model_size,                # 📏 Size of the YOLOv8 model (n=small, s=medium, m=large, l=xlarge).
+            classes=args.object_classes,               # 🏷️ Classes to detect (0=person, 1=bicycle, 4=car, 7=truck, etc...).
+            debug=args.debug,                               # 🐛 If True, saves debug images and logs to help you visualize decisions.
+            input_video_path=args.input,               # 📁 Path to input video (for debug log location)
+            batch_size=args.batch_size,                # 📦 Number of frames per inference call.
+        )
 
     tracker = ObjectTracker(
         max_disappeared=30,     # 🕵️‍♂️ Number of frames an object can be missing before being considered lost.
@@ -181,43 +229,50 @@ def main(args=None):
     # Determine keyframes
     keyframes = list(range(0, total_frames, args.skip_frames))
     
-    # Use ThreadPoolExecutor for parallel processing of keyframes
+    # Keyframes are decoded ahead on a reader thread while batches are detected
+    # on the executor; only a bounded number of batches is kept in flight, so
+    # decoded frames never pile up in memory
+    max_in_flight = args.max_workers * 2
     with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
         # Create a list to store futures
         futures = []
+        submitted = 0
+        processed = 0
         
         # Process keyframes
-        for frame_idx in keyframes:
-            # Set position to keyframe
-            video_processor.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-            ret, frame = video_processor.cap.read()
+        keyframe_reader = video_processor.iter_frames_at(keyframes)
+        # Batches hold detect_stride keyframes per detected one, so the model
+        # still sees up to batch_size frames per call
+        for batch in _chunks(keyframe_reader, args.batch_size * args.detect_stride):
+            batch_indices = [frame_idx for frame_idx, _ in batch]
+            batch_frames = [frame for _, frame in batch]
             
-            if not ret:
-                continue
-            
-            # Submit task to executor
-            future = executor.submit(
-                process_keyframe, 
-                frame_idx, 
-                frame, 
+            # Submit the batch to the executor, so the detector runs once per batch
+            futures.append(executor.submit(
+                process_keyframes, 
+                batch_indices, 
+                batch_frames, 
                 detector, 
                 tracker, 
                 tracked_objects_by_frame,
-                args.track_count
-            )
-            futures.append(future)
+                args.track_count,
+                args.detect_stride
+            ))
+            submitted += len(batch_frames)
+            print(f"\r🤖 Submitted {submitted}/{len(keyframes)} keyframes for processing", end='', flush=True)
             
-            # Print progress every 10 keyframes
-            if len(futures) % 10 == 0:
-                print(f"\r🤖 Submitted {len(futures)}/{len(keyframes)} keyframes for processing", end='', flush=True)
+            # Wait for the oldest batch once too many are in flight
+            while len(futures) - processed > max_in_flight:
+                futures[processed].result()  # This will raise any exceptions that occurred
+                processed += 1
         
         print(f"\n")
 
         # Wait for all futures to complete
-        for i, future in enumerate(futures):
-            future.result()  # This will raise any exceptions that occurred
-            if (i + 1) % 10 == 0:
-                print(f"\r🚀 Processed {i + 1}/{len(keyframes)} keyframes", end='', flush=True)
+        processed_frames = 0
+        for future in futures:
+            processed_frames += len(future.result())  # This will raise any exceptions that occurred
+            print(f"\r🚀 Processed {processed_frames}/{len(keyframes)} keyframes", end='', flush=True)
     
 
 
@@ -234,20 +289,11 @@ def main(args=None):
     # Pre-allocate crop windows array
     crop_windows = [None] * total_frames
     
-    # Process keyframes
-    for frame_idx in keyframes:
-        if frame_idx not in tracked_objects_by_frame:
-            continue
-            
+    # Process keyframes, decoding the next ones while the crop is calculated
+    tracked_keyframes = [frame_idx for frame_idx in keyframes if frame_idx in tracked_objects_by_frame]
+    for frame_idx, frame in video_processor.iter_frames_at(tracked_keyframes):
         objects = tracked_objects_by_frame[frame_idx]
         
-        # Get the actual frame for additional analysis
-        video_processor.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-        ret, frame = video_processor.cap.read()
-        
-        if not ret:
-            continue
-        
         # Calculate optimal crop window
         crop_window = crop_calculator.calculate(objects, width, height, frame)
         crop_windows[frame_idx] = crop_window
@@ -352,6 +398,7 @@ def main(args=None):
         crop_windows=smoothed_windows,
         fps=fps
     )
+    video_processor.release()
     
     # Finalize debug video if debug mode is enabled
     if args.debug:
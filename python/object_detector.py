@@ -1,20 +1,129 @@
 from ultralytics import YOLO
 import cv2
+import functools
+from dataclasses import dataclass, field
 import numpy as np
 import os
+import threading
 import urllib.request
 from PIL import Image
 import time  
+import torch
+import torchvision
+
+
+@functools.lru_cache(maxsize=None)
+def _load_yolo(model_path):
+    """Load YOLO weights once per process and share them between detectors."""
+    return YOLO(model_path)
+
+
+@functools.lru_cache(maxsize=None)
+def _model_inference_lock(model_path):
+    """Lock serialising calls into the shared model loaded from model_path."""
+    return threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def _local_model_path(model_filename):
+    """Return the path of the weights under models/, downloading them on first use."""
+    local_model_path = os.path.join('models', model_filename)
+
+    if not os.path.exists(local_model_path):
+        os.makedirs('models', exist_ok=True)
+        download_url = f'https://github.com/ultralytics/assets/releases/download/v8.3.0/{model_filename}'
+        print(f"Downloading YOLOv11 model from {download_url}...")
+        urllib.request.urlretrieve(download_url, local_model_path)
+        print(f"Model downloaded to {local_model_path}")
+    return local_model_path
+
+
+def _create_tracker():
+    """Create a KCF single-object tracker (opencv-contrib; legacy namespace on OpenCV >= 4.5.1)."""
+    if hasattr(cv2, 'TrackerKCF_create'):
+        return cv2.TrackerKCF_create()
+    return cv2.legacy.TrackerKCF_create()
+
+
+@dataclass(eq=False)
+class DetectionsBatch:
+    """
+    Detections of one frame, stored column-wise: one array per field
+    instead of one dict per detection.
+    
+    Indexing and iterating still give the old detection dicts ('box',
+    'confidence', 'class_id', 'class_name'), so code expecting a list of
+    dicts keeps working; vectorized consumers can use the arrays directly.
+    """
+    bboxes: np.ndarray       # (N, 4) int32 [x, y, width, height]
+    confidences: np.ndarray  # (N,) float, as produced by the model
+    class_ids: np.ndarray    # (N,) int32
+    names: dict = field(default_factory=dict)  # class_id -> class name
+    
+    @classmethod
+    def empty(cls, names=None):
+        """Return a batch with no detections."""
+        return cls(np.empty((0, 4), dtype=np.int32), np.empty(0, dtype=np.float32),
+                   np.empty(0, dtype=np.int32), names or {})
+    
+    def with_boxes(self, indices, bboxes):
+        """Return the detections at indices, moved to the given boxes."""
+        indices = np.asarray(indices, dtype=np.intp)
+        return DetectionsBatch(np.asarray(bboxes, dtype=np.int32).reshape(-1, 4),
+                               self.confidences[indices], self.class_ids[indices], self.names)
+    
+    def __len__(self):
+        return len(self.confidences)
+    
+    def __getitem__(self, index):
+        class_id = int(self.class_ids[index])
+        return {
+            'box': self.bboxes[index].tolist(),
+            'confidence': float(self.confidences[index]),
+            'class_id': class_id,
+            'class_name': self.names[class_id]
+        }
+    
+    def __iter__(self):
+        for box, confidence, class_id in zip(
+            self.bboxes.tolist(), self.confidences.tolist(), self.class_ids.tolist()
+        ):
+            yield {
+                'box': box,
+                'confidence': confidence,
+                'class_id': class_id,
+                'class_name': self.names[class_id]
+            }
+
+
+def _noop(*args, **kwargs):
+    """Do nothing; stands in for debug hooks when debug mode is off."""
+
+
+def _chunks(iterable, size):
+    """Yield lists of up to size consecutive items from iterable."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
 
 class ObjectDetector:
     """Class for detecting objects in video frames using YOLOv8."""
     
+    # Weights file for each model size
+    _MODEL_NAME = {size: f'yolo11{size}.pt' for size in ('n', 's', 'm', 'l', 'x')}
+    
 
 
 
 
 
-    def __init__(self, confidence_threshold=0.5, model_size='n', classes=[0], debug=False, input_video_path=None):
+    def __init__(self, confidence_threshold=0.5, model_size='n', classes=[0], debug=False, input_video_path=None, batch_size=8, use_tensorrt=False, half=True, nms_iou=None):
         """
         Initialize YOLOv8 detector.
         
@@ -24,23 +133,57 @@ class ObjectDetector:
             classes: List of class IDs to detect (default: [0] for person)
             debug: Enable debug mode to create video with detection boxes
             input_video_path: Path to input video (used to determine debug log location)
+            batch_size: Maximum number of frames passed to the model in one call
+            use_tensorrt: On a CUDA GPU, run a TensorRT engine built from the
+                weights (once per model size and GPU architecture) instead of PyTorch
+            half: Run inference in FP16 on a CUDA GPU (always FP32 on CPU)
+            nms_iou: Opt-in NMS: IoU above which overlapping boxes are suppressed when a
+                frame has more than 4 * top_n candidates left after filtering, e.g. 0.45.
+                None (the default) returns the model's detections unchanged
         """
         self.confidence_threshold = confidence_threshold
         self.model_size = model_size
         self.classes = classes
         self.debug = debug
         self.input_video_path = input_video_path
-        self.model = None
+        self.batch_size = batch_size
+        self.use_tensorrt = use_tensorrt
+        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.half = half and self.device == 'cuda'
+        self.nms_iou = nms_iou
+        self._model = None
+        self._model_lock = threading.Lock()
+        # Replaced by the shared model's lock once the model is loaded
+        self._inference_lock = threading.Lock()
+        self._classes_tensor = None
         self.debug_video_writer = None
         self.debug_video_path = None
         self.frame_count = 0
         
-        # Initialize debug video if debug mode is enabled
+        # Initialize debug video if debug mode is enabled; without it the
+        # debug hooks are no-ops, so detection never checks the flag
         if self.debug:
             self._initialize_debug_video()
+            self._maybe_debug_detections = self._debug_detections
+            self.finalize_debug_video = self._finalize_debug_video
+        else:
+            self._maybe_debug_detections = _noop
+            self.finalize_debug_video = _noop
         
-        # Initialize the model
-        self._initialize_model()
+        # The model is loaded on first use, see the model property
+    
+    @property
+    def model(self):
+        """The YOLO model, loaded on first access (thread-safe)."""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._initialize_model()
+        return self._model
+    
+    @model.setter
+    def model(self, model):
+        self._model = model
     
     def _initialize_debug_video(self):
         """Initialize debug video writer."""
@@ -97,8 +240,9 @@ class ObjectDetector:
         
         return frame_with_boxes
     
-    def finalize_debug_video(self):
-        """Finalize and close the debug video writer."""
+    def _finalize_debug_video(self):
+        """Finalize and close the debug video writer (bound as finalize_debug_video in debug mode)."""
+        # The writer is only created once the first frame has been written
         if self.debug_video_writer is not None:
             self.debug_video_writer.release()
             self.debug_video_writer = None
@@ -114,15 +258,8 @@ class ObjectDetector:
     def _initialize_model(self):
         """Initialize the YOLOv8 model."""
         try:
-            model_filename = f'yolo11{self.model_size}.pt'
-            local_model_path = os.path.join('models', model_filename)
-
-            if not os.path.exists(local_model_path):
-                os.makedirs('models', exist_ok=True)
-                download_url = f'https://github.com/ultralytics/assets/releases/download/v8.3.0/{model_filename}'
-                print(f"Downloading YOLOv11 model from {download_url}...")
-                urllib.request.urlretrieve(download_url, local_model_path)
-                print(f"Model downloaded to {local_model_path}")
+            # Resolved (and downloaded if needed) once per process per model size
+            local_model_path = _local_model_path(self._MODEL_NAME[self.model_size])
 
             # All classes are loaded by default, but we can filter them later
             # The classes are:
@@ -135,12 +272,28 @@ class ObjectDetector:
             # see https://github.com/ultralytics/ultralytics/blob/main/ultralytics/cfg/datasets/coco.yaml
             #
             # Arguments: https://docs.ultralytics.com/modes/predict/#inference-sources
-            self.model = YOLO(local_model_path)
+            if self.use_tensorrt and self.device == 'cuda':
+                local_model_path = self._tensorrt_engine(local_model_path)
+            self.model = _load_yolo(local_model_path)
+            self._inference_lock = _model_inference_lock(local_model_path)
             print(f"YOLOv11-{self.model_size} model loaded successfully")
         except Exception as e:
             print(f"Error loading YOLOv8 model: {e}")
             raise
     
+    def _tensorrt_engine(self, weights_path):
+        """Return the TensorRT engine for the weights, exporting it on first use."""
+        major, minor = torch.cuda.get_device_capability()
+        engine_path = os.path.splitext(weights_path)[0] + f'_sm{major}{minor}.engine'
+        
+        # Engines only run on the GPU architecture they were built for
+        if not os.path.exists(engine_path):
+            print(f"Building TensorRT engine {engine_path} (one-time)...")
+            exported = YOLO(weights_path).export(format='engine', half=True, dynamic=True,
+                                                 batch=self.batch_size, device=0)
+            os.replace(exported, engine_path)
+        return engine_path
+    
 
 
 
@@ -164,84 +317,190 @@ class ObjectDetector:
             - 'class_name': class name
             - 'class_id': class ID
         """
-
-        if self.model is None:
-            raise ValueError("Model not initialized")
+        return self.detect_batch([frame], top_n=top_n)[0]
+    
+    def detect_batch(self, frames, top_n=1):
+        """
+        Detect objects in several frames, running inference on up to
+        batch_size frames per model call.
         
-        # Run YOLOv11 inference
-        results = self.model(frame, 
-                            verbose=False, 
-                            classes=self.classes,
-                            )[0]
+        Args:
+            frames: Sequence of input frames (numpy arrays), or an (N, H, W, 3) array
+            top_n: Number of top detections to return per frame, see detect()
+            
+        Returns:
+            One DetectionsBatch per frame, in the same order as frames
+        """
+        frames = list(frames)
+        detections_per_frame = []
+        model = self.model
         
-        # Process detections
-        detections = []
-
-        # Collect all valid detections
-        for det in results.boxes.data.cpu().numpy():
-            x1, y1, x2, y2, conf, cls = det
-
-            # Skip if the confidence is below the threshold
-            if conf < self.confidence_threshold:
-                continue
-
-            width = x2 - x1
-            height = y2 - y1
-
-            x = int(x1)
-            y = int(y1)
-            w = int(width)
-            h = int(height)
-            class_id = int(cls)
-            class_name = results.names[int(cls)]
-            confidence = float(conf)
-
-            detection = {
-                'box': [x, y, w, h],
-                'confidence': confidence,
-                'class_id': class_id,
-                'class_name': class_name
-            }
-
-            detections.append(detection)
-
-        # Sort detections by confidence, in descending order
-        detections.sort(key=lambda x: x['confidence'], reverse=True)
-
-        # If top_n is specified, keep only the top 'n' detections
-        if top_n > 0:
-            detections = detections[:top_n]
-
-        # DEBUG DETECTIONS!
-        if self.debug:
-            # Initialize video writer on first frame
-            self._initialize_video_writer(frame)
+        for start in range(0, len(frames), self.batch_size):
+            batch = frames[start:start + self.batch_size]
+            
+            # Run YOLOv11 inference on the whole batch at once. The model is
+            # shared between detectors and worker threads, and isn't safe to
+            # call concurrently
+            with self._inference_lock:
+                results = model(batch, 
+                                verbose=False, 
+                                classes=self.classes,
+                                device=self.device,
+                                half=self.half,
+                                )
             
-            # Draw detection boxes on frame
-            frame_with_boxes = self._draw_detection_boxes(frame, detections)
+            for frame, result in zip(batch, results):
+                detections = self._process_result(result, top_n)
+                
+                # DEBUG DETECTIONS!
+                self._maybe_debug_detections(frame, detections)
+                
+                detections_per_frame.append(detections)
+        
+        return detections_per_frame
+    
+    def detect_stream(self, frames, stride=3, top_n=1):
+        """
+        Detect objects in a sequence of frames, running the model only on
+        every stride-th ("reference") frame.
+        
+        The detections of a reference frame are carried over to the frames
+        that follow it by a KCF tracker per box; a box is dropped once its
+        tracker loses the object. Reference frames are still batched, so the
+        model sees up to batch_size of them per call.
+        
+        Args:
+            frames: Iterable of input frames (numpy arrays)
+            stride: Run the model on every stride-th frame (1 = every frame)
+            top_n: Number of top detections to return per frame, see detect()
             
-            # Write frame to video
-            if self.debug_video_writer is not None:
-                self.debug_video_writer.write(frame_with_boxes)
-                self.frame_count += 1
+        Yields:
+            One DetectionsBatch per frame, in the same order as frames
+        """
+        if stride <= 1:
+            for batch in _chunks(frames, self.batch_size):
+                yield from self.detect_batch(batch, top_n=top_n)
+            return
+        
+        for group in _chunks(frames, self.batch_size * stride):
+            reference_detections = self.detect_batch(group[::stride], top_n=top_n)
             
-            # Log detection details to text file
-            if detections:
-                # Use the same directory as the input video for debug logs
-                if self.input_video_path:
-                    input_dir = os.path.dirname(os.path.abspath(self.input_video_path))
-                    debug_folder = os.path.join(input_dir, "debug_logs")
-                else:
-                    debug_folder = "debug_logs"
+            for offset, frame in enumerate(group):
+                if offset % stride == 0:
+                    reference = reference_detections[offset // stride]
+                    trackers = []
+                    for index, box in enumerate(reference.bboxes.tolist()):
+                        tracker = _create_tracker()
+                        tracker.init(frame, tuple(box))
+                        trackers.append((index, tracker))
+                    yield reference
+                    continue
                 
-                os.makedirs(debug_folder, exist_ok=True)
-                for detection in detections:
-                    with open(os.path.join(debug_folder, "log1_detections.txt"), "a") as f:
-                        f.write(f"Frame {self.frame_count}: Detector Box: {detection['box']} "
-                                f"class_name: {detection['class_name']}, "
-                                f"Confidence: {detection['confidence']}\n")
-
-        return detections
+                # Move the reference detections along with their trackers
+                tracked, boxes = [], []
+                for index, tracker in trackers:
+                    ok, box = tracker.update(frame)
+                    if ok:
+                        tracked.append((index, tracker))
+                        boxes.append(box)
+                trackers = tracked
+                yield reference.with_boxes([index for index, _ in trackers], boxes)
+    
+    def _process_result(self, results, top_n):
+        """Turn the YOLO result for one frame into a DetectionsBatch."""
+        # Rows of [x1, y1, x2, y2, confidence, class_id]
+        data = results.boxes.data
+        if torch.is_tensor(data):
+            data = self._filter_on_device(data, top_n).cpu().numpy()
+        else:
+            data = np.asarray(data)
+        if len(data) == 0:
+            return DetectionsBatch.empty(results.names)
+
+        # Keep detections above the confidence threshold, in the wanted classes
+        # (a no-op for tensors, which were already filtered on the device)
+        keep = data[:, 4] >= self.confidence_threshold
+        if self.classes is not None:
+            keep &= np.isin(data[:, 5].astype(int), self.classes)
+        data = data[keep]
+
+        # Prune overlapping boxes with OpenCV's NMS when many candidates are left
+        if self._needs_nms(len(data), top_n):
+            xywh = np.column_stack((data[:, :2], data[:, 2:4] - data[:, :2]))
+            kept = cv2.dnn.NMSBoxes(xywh.tolist(), data[:, 4].tolist(), self.confidence_threshold, self.nms_iou)
+            data = data[np.asarray(kept, dtype=np.intp).reshape(-1)]
+        confidences = data[:, 4]
+
+        # Order by confidence, descending; with top_n only the top 'n' are fully sorted
+        if 0 < top_n < len(data):
+            top = np.argpartition(-confidences, top_n - 1)[:top_n]
+            order = top[np.argsort(-confidences[top], kind='stable')]
+        else:
+            order = np.argsort(-confidences, kind='stable')
+        data = data[order]
+
+        # [x, y, width, height], truncated to ints
+        boxes = np.column_stack((data[:, :2], data[:, 2:4] - data[:, :2])).astype(np.int32)
+
+        return DetectionsBatch(
+            bboxes=boxes,
+            # Confidences keep the model's precision, so callers see the values it produced
+            confidences=data[:, 4],
+            class_ids=data[:, 5].astype(np.int32),
+            names=results.names,
+        )
+    
+    def _filter_on_device(self, data, top_n):
+        """
+        Drop low-confidence and unwanted-class rows and keep the top_n most
+        confident ones while the boxes are still on the model's device, so
+        only the few surviving rows are copied to the host.
+        """
+        keep = data[:, 4] >= self.confidence_threshold
+        if self.classes is not None:
+            if self._classes_tensor is None or self._classes_tensor.device != data.device:
+                self._classes_tensor = torch.as_tensor(self.classes, device=data.device)
+            keep &= torch.isin(data[:, 5].long(), self._classes_tensor)
+        data = data[keep]
+        
+        if self._needs_nms(len(data), top_n):
+            data = data[torchvision.ops.nms(data[:, :4], data[:, 4], self.nms_iou)]
+        if 0 < top_n < len(data):
+            data = data[torch.topk(data[:, 4], top_n).indices]
+        return data
+    
+    def _needs_nms(self, count, top_n):
+        """Whether count candidates are enough to be worth another NMS pass."""
+        return self.nms_iou is not None and count > top_n * 4
+    
+    def _debug_detections(self, frame, detections):
+        """Write a frame with its detection boxes to the debug video and log."""
+        # Initialize video writer on first frame
+        self._initialize_video_writer(frame)
+        
+        # Draw detection boxes on frame
+        frame_with_boxes = self._draw_detection_boxes(frame, detections)
+        
+        # Write frame to video
+        if self.debug_video_writer is not None:
+            self.debug_video_writer.write(frame_with_boxes)
+            self.frame_count += 1
+        
+        # Log detection details to text file
+        if detections:
+            # Use the same directory as the input video for debug logs
+            if self.input_video_path:
+                input_dir = os.path.dirname(os.path.abspath(self.input_video_path))
+                debug_folder = os.path.join(input_dir, "debug_logs")
+            else:
+                debug_folder = "debug_logs"
+            
+            os.makedirs(debug_folder, exist_ok=True)
+            for detection in detections:
+                with open(os.path.join(debug_folder, "log1_detections.txt"), "a") as f:
+                    f.write(f"Frame {self.frame_count}: Detector Box: {detection['box']} "
+                            f"class_name: {detection['class_name']}, "
+                            f"Confidence: {detection['confidence']}\n")
     
 
 
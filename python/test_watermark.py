@@ -4,22 +4,24 @@ Test script for watermark functionality
 """
 
 import cv2
+import logging
 import numpy as np
 import os
 from config import config
 from watermark import watermark_renderer
 
+logger = logging.getLogger(__name__)
+
 def create_test_frame(width=640, height=480):
     """Create a test frame with a gradient background."""
-    frame = np.zeros((height, width, 3), dtype=np.uint8)
+    frame = np.empty((height, width, 3), dtype=np.uint8)
     
-    # Create a gradient background
-    for y in range(height):
-        for x in range(width):
-            r = int(255 * x / width)
-            g = int(255 * y / height)
-            b = int(255 * (x + y) / (width + height))
-            frame[y, x] = [b, g, r]
+    # Create a gradient background, broadcasting over rows and columns
+    y = np.arange(height)[:, None]
+    x = np.arange(width)[None, :]
+    frame[..., 0] = 255 * (x + y) // (width + height)
+    frame[..., 1] = 255 * y // height
+    frame[..., 2] = 255 * x // width
     
     return frame
 
@@ -122,10 +124,9 @@ def main():
         print("=" * 50)
         print("All watermark tests completed successfully!")
         
-    except Exception as e:
-        print(f"Test failed with error: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        # The traceback is only formatted if the record is actually emitted
+        logger.exception("Test failed with error")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
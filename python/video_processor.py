@@ -1,18 +1,49 @@
 import cv2
+import itertools
 import numpy as np
 import os
 import sys
+import time
 import platform
+import subprocess
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Use absolute imports that work in both development and bundled environments
 try:
     # Try direct import first (when in same directory)
-    from watermark import watermark_renderer
+    from watermark import WatermarkWorker
+    from ffmpeg_manager import get_ffmpeg_path
 except ImportError:
     # Fallback to python directory import (when bundled)
     sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-    from python.watermark import watermark_renderer
+    from python.watermark import WatermarkWorker
+    from python.ffmpeg_manager import get_ffmpeg_path
+
+# Optional batched decoder (multi-threaded FFmpeg in C++); OpenCV is used when unavailable
+try:
+    from torchcodec.decoders import VideoDecoder
+except (ImportError, RuntimeError):
+    VideoDecoder = None
+
+# Most frames decoded per batch by the optional batched decoder, and the
+# memory one batch may take; large frames get smaller batches (1080p: 21)
+DECODE_BATCH_SIZE = 32
+DECODE_BATCH_BYTES = 128 * 1024 * 1024
+
+# Frames that may wait between cropping and watermarking/encoding
+WATERMARK_QUEUE_SIZE = 8
+
+# Frames cropped together on the crop thread pool when generating the output
+CROP_BATCH_SIZE = 8
+
+# Frames that may be decoded ahead of the stage consuming them
+PREFETCH_SIZE = 32
+
+# Forward gaps up to this many frames are skipped with grab() instead of a seek
+MAX_GRAB_GAP = 16
 
 def get_app_path():
     """Get the path to the application's resources directory."""
@@ -48,6 +79,109 @@ def get_app_path():
         print(f"Running in normal Python environment, using current directory: {current_path}")
         return current_path
 
+def clamp_crop_windows(crop_windows, frame_width, frame_height):
+    """
+    Clamp every crop window to the frame bounds in a single vectorized pass.
+
+    Windows that overhang an edge are shifted back inside the frame, and are
+    only shrunk when they are larger than the frame itself.
+
+    Returns:
+        (N, 4) int32 array of [x, y, width, height]
+    """
+    crops = np.asarray(crop_windows, dtype=np.int32).reshape(-1, 4)
+    frame_size = np.array([frame_width, frame_height], dtype=np.int32)
+
+    xy = np.maximum(np.minimum(crops[:, :2], frame_size - crops[:, 2:]), 0)
+    wh = np.minimum(crops[:, 2:], frame_size - xy)
+
+    return np.hstack((xy, wh))
+
+def _even(size):
+    """Round a frame dimension down to an even number of pixels (at least 2)."""
+    size = int(size)
+    return max(2, size - size % 2)
+
+def _open_capture(path):
+    """
+    Open a video for decoding, preferring hardware-accelerated decode:
+    AVFoundation on macOS, otherwise OpenCV's FFmpeg backend with any available
+    HW decoder (NVDEC, VAAPI, D3D11, ...). Falls back to the default backend.
+    """
+    if platform.system() == 'Darwin':
+        cap = cv2.VideoCapture(path, cv2.CAP_AVFOUNDATION)
+    elif hasattr(cv2, 'CAP_PROP_HW_ACCELERATION'):
+        # HW acceleration has to be requested when opening, not set afterwards
+        cap = cv2.VideoCapture(path, cv2.CAP_FFMPEG, [
+            cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY,
+            cv2.CAP_PROP_HW_DEVICE, 0,
+        ])
+    else:
+        cap = None
+    
+    if cap is None or not cap.isOpened():
+        cap = cv2.VideoCapture(path)
+    return cap
+
+class FramePrefetcher(threading.Thread):
+    """
+    Reads the frames at the given indices on a background thread into a
+    bounded queue, so decoding overlaps with whatever the consumer does
+    with each frame while memory stays capped at maxsize frames.
+    """
+    
+    _DONE = object()
+    
+    def __init__(self, cap, frame_indices, maxsize=PREFETCH_SIZE):
+        super().__init__(daemon=True)
+        self.cap = cap
+        self.frame_indices = frame_indices
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.error = None
+        self._stopped = threading.Event()
+    
+    def run(self):
+        try:
+            position = None
+            for frame_idx in self.frame_indices:
+                if self._stopped.is_set():
+                    break
+                
+                # Short forward gaps are cheaper to decode through than to seek over
+                if position is not None and 0 <= frame_idx - position <= MAX_GRAB_GAP:
+                    for _ in range(frame_idx - position):
+                        self.cap.grab()
+                else:
+                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+                
+                ret, frame = self.cap.read()
+                position = frame_idx + 1
+                if ret:
+                    self.queue.put((frame_idx, frame))
+        except Exception as e:
+            self.error = e
+        finally:
+            self.queue.put(self._DONE)
+    
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is self._DONE:
+                break
+            yield item
+        if self.error is not None:
+            raise self.error
+    
+    def stop(self):
+        """Stop reading and wait for the thread, discarding frames not yet consumed."""
+        self._stopped.set()
+        while self.is_alive():
+            try:
+                self.queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self.join()
+
 class VideoProcessor:
     def __init__(self):
         self.cap = None
@@ -55,15 +189,18 @@ class VideoProcessor:
         self.frames = None
         self.current_frame_idx = 0
         self.video_info = {}
-        print("VideoProcessor initialized with OpenCV for detection and MoviePy for video processing")
+        self._crop_executor = None
+        print("VideoProcessor initialized with OpenCV for decoding and FFmpeg for encoding")
     
     def load_video(self, video_path):
         """Load video file and extract basic information."""
         if not os.path.exists(video_path):
             raise FileNotFoundError(f"Video file not found: {video_path}")
         
-        self.cap = cv2.VideoCapture(video_path)
+        self.cap = _open_capture(video_path)
         # self.cap = cv2.VideoCapture(video_path, cv2.CAP_DSHOW)
+        if not self.cap.isOpened():
+            raise ValueError(f"Could not open video file: {video_path}")
         self.video_info = {
             'width': int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
             'height': int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
@@ -91,64 +228,109 @@ class VideoProcessor:
             yield frame
             self.current_frame_idx += 1
     
+    def iter_frames_at(self, frame_indices):
+        """
+        Yield (frame_idx, frame) for each of the given ascending frame indices,
+        decoded ahead on a background thread. Frames that can't be read are skipped.
+        """
+        if self.cap is None:
+            raise ValueError("No video loaded. Call load_video() first.")
+        
+        prefetcher = FramePrefetcher(self.cap, frame_indices)
+        prefetcher.start()
+        try:
+            yield from prefetcher
+        finally:
+            prefetcher.stop()
+    
     def apply_crop(self, frame, crop_window):
         """Apply crop window to a frame."""
-        x, y, w, h = crop_window
+        frame_height, frame_width = frame.shape[:2]
+        crop = np.asarray(crop_window, dtype=np.int64)
         
-        # Ensure crop window is within frame boundaries
-        x = max(0, min(x, frame.shape[1] - 1))
-        y = max(0, min(y, frame.shape[0] - 1))
-        w = max(1, min(w, frame.shape[1] - x))
-        h = max(1, min(h, frame.shape[0] - y))
+        # Ensure crop window is within frame boundaries: position first, then a size of at least 1
+        x, y = np.clip(crop[:2], 0, (frame_width - 1, frame_height - 1)).tolist()
+        w, h = np.clip(crop[2:], 1, (frame_width - x, frame_height - y)).tolist()
         
         # Apply crop
         return frame[y:y+h, x:x+w]
     
-    def convert_to_h264(self, input_path):
-        """Convert the given video to H.264 format using MoviePy (preserves audio)."""
-        temp_output = "temp_h264_output.mp4"
+    def apply_crop_batch(self, frames, crop_windows):
+        """
+        Apply one crop window per frame, copying the crops out in parallel on
+        a thread pool shared across calls (NumPy releases the GIL for the copies)
+        and shut down by release().
         
-        try:
-            print(f"Converting video to H.264 with MoviePy: {temp_output}")
-            
-            # Import MoviePy here to ensure it's available
-            try:
-                from moviepy import VideoFileClip
-            except ImportError:
-                # Fallback to editor import
-                from moviepy.editor import VideoFileClip
-            
-            # Load the video (this preserves audio)
-            video = VideoFileClip(input_path)
-            
-            # Write with H.264 codec (preserves audio)
-            print("Writing H.264 video with audio...")
-            video.write_videofile(
-                temp_output,
-                codec='libx264',
-                audio_codec='aac'
-            )
-            
-            # Clean up
-            video.close()
-            
-            # Overwrite original video with the new one
-            os.replace(temp_output, input_path)
-            print(f"H.264 conversion completed with audio preserved")
-            
-        except Exception as e:
-            # Cleanup on error
-            if os.path.exists(temp_output):
-                os.remove(temp_output)
-            raise RuntimeError(f"H.264 conversion failed: {e}")
-
-
-    # merge_audio method removed - no longer needed with MoviePy approach
-
+        When all crops have the same size they are copied into a single
+        (N, H, W, 3) allocation rather than one array per frame. Every call
+        gets its own buffer, so the returned frames belong to the caller and
+        are never overwritten by a later call.
+        
+        Returns:
+            List of C-contiguous cropped frames, in the same order as frames
+        """
+        if self._crop_executor is None:
+            self._crop_executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+        
+        crops = [self.apply_crop(frame, crop_window) for frame, crop_window in zip(frames, crop_windows)]
+        if not crops or len({crop.shape for crop in crops}) != 1:
+            return list(self._crop_executor.map(lambda crop: np.copy(crop, order='C'), crops))
+        
+        buf = np.empty((len(crops),) + crops[0].shape, dtype=crops[0].dtype)
+        out = list(buf)
+        for _ in self._crop_executor.map(np.copyto, out, crops):
+            pass
+        return out
     
+    def _iter_frames(self, frame_count):
+        """Yield up to frame_count BGR frames, in order, from the start of the video."""
+        if VideoDecoder is not None:
+            decoder = VideoDecoder(self.video_info['path'])
+            stop = min(frame_count, len(decoder))
+            frame_bytes = self.video_info['width'] * self.video_info['height'] * 3
+            batch_size = max(1, min(DECODE_BATCH_SIZE, DECODE_BATCH_BYTES // frame_bytes))
+            for start in range(0, stop, batch_size):
+                batch = decoder.get_frames_in_range(start, min(start + batch_size, stop)).data
+                # (N, C, H, W) RGB tensor -> (N, H, W, C) BGR views
+                yield from batch.permute(0, 2, 3, 1).numpy()[..., ::-1]
+            return
+        
+        # Read sequentially rather than seeking to every frame
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        for _ in range(frame_count):
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+            yield frame
+    
+    def _open_ffmpeg_writer(self, output_path, width, height, fps, duration=None):
+        """
+        Start an FFmpeg process that encodes raw BGR frames from stdin to H.264.
+        
+        FFmpeg converts the BGR frames to YUV itself, so no colour conversion
+        is needed in Python. The output is yuv420p, the format players and
+        browsers can all decode, so width and height must be even. The audio
+        track of the source video, if any, is muxed into the output as AAC;
+        a shorter track leaves the rest silent, a longer one is cut at
+        duration (in seconds) so the output is as long as the video.
+        """
+        cmd = [
+            get_ffmpeg_path(), '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', str(fps),
+            '-i', 'pipe:0',
+            '-i', self.video_info['path'],
+            '-map', '0:v', '-map', '1:a?',
+            '-c:v', 'libx264', '-pix_fmt', 'yuv420p',
+            '-c:a', 'aac',
+        ]
+        if duration is not None:
+            cmd += ['-t', str(duration)]
+        cmd.append(output_path)
+        
+        return subprocess.Popen(cmd, stdin=subprocess.PIPE)
     
     def generate_output_video(self, output_path, crop_windows, fps=None):
-        """Generate output video with the specified crop windows using MoviePy."""
+        """Generate output video with the specified crop windows, streaming frames to FFmpeg."""
         if self.cap is None:
             raise ValueError("No video loaded. Call load_video() first.")
         
@@ -160,101 +342,72 @@ class VideoProcessor:
         if output_dir and not os.path.exists(output_dir):
             os.makedirs(output_dir)
         
+        writer = None
+        worker = None
+        
         try:
-            # Import MoviePy
-            from moviepy import VideoFileClip
-            print("Using MoviePy for video processing...")
+            # Clamp all crop windows to the frame bounds up front, so the
+            # per-frame loop only has to slice
+            crops = clamp_crop_windows(crop_windows, self.video_info['width'], self.video_info['height'])
             
-            # Load original video with MoviePy (preserves audio)
-            original_video = VideoFileClip(self.video_info['path'])
-            print(f"Loaded original video: {original_video.duration:.2f}s, {original_video.fps} fps")
-            
-            # Get first crop window to determine output dimensions
-            first_crop = crop_windows[0]
-            crop_width, crop_height = first_crop[2], first_crop[3]
+            # Get first clamped crop window to determine output dimensions, rounded
+            # down to even sizes for yuv420p (odd crops lose their last row/column)
+            crop_width, crop_height = _even(crops[0, 2]), _even(crops[0, 3])
             print(f"Output dimensions: {crop_width}x{crop_height}")
             
-            # Process frames one by one and create a new video clip
-            print("Processing video frames with MoviePy...")
-            
-            # Create a list to store processed frames
-            processed_frames = []
-            
-            # Process each frame using OpenCV for cropping, then convert to MoviePy
-            for i in range(len(crop_windows)):
-                # Get frame from OpenCV (we already have this capability)
-                self.cap.set(cv2.CAP_PROP_POS_FRAMES, i)
-                ret, frame = self.cap.read()
-                if not ret:
-                    break
-                
-                # Apply crop window
-                crop_window = crop_windows[i]
-                x, y, w, h = crop_window
-                
-                # Ensure crop coordinates are within bounds
-                x = max(0, min(x, frame.shape[1] - w))
-                y = max(0, min(y, frame.shape[0] - h))
-                w = min(w, frame.shape[1] - x)
-                h = min(h, frame.shape[0] - y)
-                
-                # Crop the frame
-                cropped_frame = frame[y:y+h, x:x+w]
-                
-                # Resize if needed
-                if cropped_frame.shape[1] != crop_width or cropped_frame.shape[0] != crop_height:
-                    cropped_frame = cv2.resize(cropped_frame, (crop_width, crop_height))
-                
-                # Apply watermark
-                watermarked_frame = watermark_renderer.apply_watermark(cropped_frame)
-                
-                # Convert BGR to RGB for MoviePy
-                rgb_frame = cv2.cvtColor(watermarked_frame, cv2.COLOR_BGR2RGB)
-                processed_frames.append(rgb_frame)
-                
-                if i % 100 == 0:
-                    print(f"\r🎥 Processed {i}/{len(crop_windows)} frames", end='', flush=True)
+            # Frames are streamed straight into FFmpeg as they are processed
+            print("Processing video frames and encoding with FFmpeg...")
+            writer = self._open_ffmpeg_writer(output_path, crop_width, crop_height, fps,
+                                              duration=len(crop_windows) / fps)
             
-            print(f"\n✅ Successfully processed {len(processed_frames)} frames")
+            # Watermarking and encoding run on a worker thread, overlapping with decoding
+            stdin = writer.stdin
+            worker = WatermarkWorker(lambda f: stdin.write(np.ascontiguousarray(f)), maxsize=WATERMARK_QUEUE_SIZE)
+            worker.start()
             
-            # Extract and save audio separately for debugging
-            print("Extracting audio for debugging...")
-            if original_video.audio is not None:
-                audio_path = output_path.replace('.mp4', '_audio.wav')
-                original_video.audio.write_audiofile(audio_path)
-                print(f"✅ Audio extracted to: {audio_path}")
-                print(f"Audio info: {original_video.audio.duration:.2f}s, {original_video.audio.fps} Hz")
-            else:
-                print("❌ No audio found in original video")
+            # Reusable resize buffers, instead of a fresh array per frame. One per
+            # queue slot, plus the one the worker holds and the one being filled
+            resize_bufs = np.empty((WATERMARK_QUEUE_SIZE + 2, crop_height, crop_width, 3), dtype=np.uint8)
+            frame_count = 0
             
-            # Create MoviePy clip from processed frames
-            from moviepy.video.io.ImageSequenceClip import ImageSequenceClip
-            processed_video = ImageSequenceClip(processed_frames, fps=fps)
+            # Progress is rate-limited by wall-clock time rather than printed
+            # every N frames, so console I/O doesn't stall the loop
+            progress_interval = 0.5
+            last_progress = time.monotonic()
             
-            # Add audio from original video
-            print("Adding audio to processed video...")
-            if original_video.audio is not None:
-                print(f"Audio found: {original_video.audio.duration:.2f}s")
-                # Create final video with audio by setting the audio attribute
-                final_video = processed_video
-                final_video.audio = original_video.audio
-                print(f"Audio added: {original_video.audio.duration:.2f}s")
-            else:
-                print("No audio found in original video")
-                final_video = processed_video
+            # Crop the decoded frames in batches on the crop thread pool, then
+            # hand them to FFmpeg one by one
+            pairs = zip(crops.tolist(), self._iter_frames(len(crops)))
+            for batch in iter(lambda: list(itertools.islice(pairs, CROP_BATCH_SIZE)), []):
+                # Windows trimmed to the even output size
+                windows = [(x, y, min(w, crop_width), min(h, crop_height)) for (x, y, w, h), _ in batch]
+                for cropped_frame in self.apply_crop_batch([frame for _, frame in batch], windows):
+                    # Resize if needed
+                    if cropped_frame.shape[1] != crop_width or cropped_frame.shape[0] != crop_height:
+                        resize_buf = resize_bufs[frame_count % len(resize_bufs)]
+                        cropped_frame = cv2.resize(cropped_frame, (crop_width, crop_height), dst=resize_buf)
+                    
+                    # The worker watermarks the frame in place, which we own, and
+                    # writes it as BGR; FFmpeg does the only colour conversion
+                    worker.submit(cropped_frame)
+                    frame_count += 1
+                
+                now = time.monotonic()
+                if now - last_progress > progress_interval:
+                    sys.stdout.write(f"\r🎥 Processed {frame_count}/{len(crop_windows)} frames")
+                    sys.stdout.flush()
+                    last_progress = now
             
-            # Write the final video with H.264 video and AAC audio
-            print("Writing final video with MoviePy...")
-            final_video.write_videofile(
-                output_path,
-                codec='libx264',
-                audio_codec='aac',
-                fps=fps
-            )
+            print(f"\n✅ Successfully processed {frame_count} frames")
             
-            # Clean up
-            original_video.close()
-            processed_video.close()
+            # Finish encoding
+            worker.close()
+            worker = None
+            writer.stdin.close()
+            return_code = writer.wait()
+            writer = None
+            if return_code != 0:
+                raise RuntimeError(f"FFmpeg exited with code {return_code}")
             
             # Verify output file exists and has content
             if os.path.exists(output_path):
@@ -267,16 +420,33 @@ class VideoProcessor:
                 raise RuntimeError("Output file was not created")
                 
         except Exception as e:
-            print(f"❌ Error in MoviePy video processing: {e}")
+            print(f"❌ Error in video processing: {e}")
+            # Stop FFmpeg if it is still running
+            if writer is not None:
+                writer.kill()
+                writer.wait()
+            if worker is not None:
+                worker.stop()
             # Clean up output file if it exists
             if os.path.exists(output_path):
                 os.remove(output_path)
             raise
 
     
-    def __del__(self):
-        """Clean up resources."""
-        if self.cap:
+    def release(self):
+        """Release the video capture and shut down the crop thread pool."""
+        if self.cap is not None:
             self.cap.release()
+            self.cap = None
+        if self._crop_executor is not None:
+            self._crop_executor.shutdown()
+            self._crop_executor = None
         if self.writer:
-            self.writer.release() 
\ No newline at end of file
+            self.writer.release()
+            self.writer = None
+    
+    def __del__(self):
+        """Clean up resources."""
+        # __init__ may not have completed
+        if hasattr(self, '_crop_executor'):
+            self.release() 
\ No newline at end of file
@@ -1,113 +1,266 @@
+import queue
+import threading
 import cv2
 import numpy as np
 from config import config
 
+# Padding in pixels between the watermark text and its background rectangle
+SPRITE_PADDING = 5
+
+# OpenCV builds without CUDA still expose cv2.cuda, but report no devices
+try:
+    CUDA_AVAILABLE = cv2.cuda.getCudaEnabledDeviceCount() > 0
+except (AttributeError, cv2.error):
+    CUDA_AVAILABLE = False
+
+def blend_roi(roi, sprite, background_weight, scratch=None):
+    """
+    Blend a premultiplied sprite onto a frame region in place:
+    roi = roi * background_weight + sprite, where background_weight is 1 - opacity.
+    
+    scratch is an optional buffer shaped like sprite, used as the intermediate
+    when roi cannot be written to directly.
+    
+    OpenCV dispatches addWeighted to SSE/AVX2/NEON kernels at runtime, so
+    this stays vectorized on every platform the app ships to.
+    """
+    if roi.strides[1:] == (3, 1):
+        # Pixels are contiguous within rows, so OpenCV can write straight
+        # into the view without a temporary
+        cv2.addWeighted(roi, background_weight, sprite, 1.0, 0, dst=roi)
+    else:
+        # OpenCV would silently write to a copy of this view; assign back instead
+        roi[...] = cv2.addWeighted(roi, background_weight, sprite, 1.0, 0, dst=scratch)
+
+# Text origin (x, y) for each position, given
+# (frame_width, frame_height, text_width, text_height, margin)
+TEXT_POSITIONS = {
+    "top-left": lambda fw, fh, tw, th, m: (m, m + th),
+    "top-right": lambda fw, fh, tw, th, m: (fw - tw - m, m + th),
+    "bottom-left": lambda fw, fh, tw, th, m: (m, fh - m),
+    "bottom-right": lambda fw, fh, tw, th, m: (fw - tw - m, fh - m),
+    "center": lambda fw, fh, tw, th, m: ((fw - tw) // 2, (fh + th) // 2),
+}
+
 class WatermarkRenderer:
     """Handles rendering watermarks on video frames."""
     
     def __init__(self):
-        self.watermark_config = config.get_watermark_config()
+        self._layout_cache = {}
+        self._gpu_sprite_cache = {}
+        self._text_size_cache = {}
+        self.update_config()
+        
+        # Reload only when the config actually changes, never from the frame loop
+        config.register_listener(self.update_config)
     
     def update_config(self):
         """Update watermark configuration from config file."""
         self.watermark_config = config.get_watermark_config()
+        self._enabled = bool(self.watermark_config["enabled"])
+        
+        # Quantize opacity to 8 bits, the finest step a uint8 frame can show, so
+        # the sprite and background weights always sum to exactly one
+        alpha = int(round(self.watermark_config["opacity"] * 255))
+        opacity = alpha / 255.0
+        self._background_weight = (255 - alpha) / 255.0
+        self._layout_cache.clear()
+        self._gpu_sprite_cache.clear()
+        
+        # The sprite only depends on the settings, so render it once here
+        self._sprite, self._text_size = self._render_sprite(
+            self.watermark_config["text"],
+            opacity,
+            self.watermark_config["font_scale"],
+            self.watermark_config["thickness"],
+            tuple(self.watermark_config["color"]),
+        )
+    
+    def _get_text_size(self, text, font, font_scale, thickness):
+        """Get text size, memoized since the text settings rarely change."""
+        key = (text, font, font_scale, thickness)
+        text_size = self._text_size_cache.get(key)
+        if text_size is None:
+            text_size = cv2.getTextSize(text, font, font_scale, thickness)[0]
+            self._text_size_cache[key] = text_size
+        return text_size
     
     def _get_text_position(self, frame_shape, text_size, position, margin):
         """Calculate text position based on frame dimensions and desired position."""
         frame_height, frame_width = frame_shape[:2]
-        text_width, text_height = text_size
-        
-        if position == "top-left":
-            x = margin
-            y = margin + text_height
-        elif position == "top-right":
-            x = frame_width - text_width - margin
-            y = margin + text_height
-        elif position == "bottom-left":
-            x = margin
-            y = frame_height - margin
-        elif position == "bottom-right":
-            x = frame_width - text_width - margin
-            y = frame_height - margin
-        elif position == "center":
-            x = (frame_width - text_width) // 2
-            y = (frame_height + text_height) // 2
-        else:
-            # Default to bottom-right
-            x = frame_width - text_width - margin
-            y = frame_height - margin
+        
+        # Unknown positions default to bottom-right
+        place = TEXT_POSITIONS.get(position, TEXT_POSITIONS["bottom-right"])
+        x, y = place(frame_width, frame_height, text_size[0], text_size[1], margin)
         
         return int(x), int(y)
     
-    def _create_watermark_overlay(self, frame, text, position, opacity, font_scale, thickness, color, margin):
-        """Create a watermark overlay for the frame."""
-        # Create a copy of the frame to work with
-        overlay = frame.copy()
+    def _render_sprite(self, text, opacity, font_scale, thickness, color):
+        """
+        Render the watermark sprite: text on a black background rectangle.
         
+        Returns:
+            (sprite, text_size) where sprite is already multiplied by opacity
+        """
         # Get text size
         font = cv2.FONT_HERSHEY_SIMPLEX
-        text_size = cv2.getTextSize(text, font, font_scale, thickness)[0]
+        text_width, text_height = self._get_text_size(text, font, font_scale, thickness)
         
-        # Calculate position
-        x, y = self._get_text_position(frame.shape, text_size, position, margin)
+        # The text sits on a background rectangle for better visibility
+        sprite = np.zeros((text_height + 2 * SPRITE_PADDING, text_width + 2 * SPRITE_PADDING, 3), dtype=np.uint8)
+        # Antialiasing is imperceptible on a semi-transparent overlay, so keep the fast rasterizer
+        cv2.putText(sprite, text, (SPRITE_PADDING, text_height + SPRITE_PADDING), font, font_scale, color, thickness,
+                    lineType=cv2.LINE_8)
         
-        # Create text with background for better visibility
-        # First, draw a semi-transparent background rectangle
-        padding = 5
-        rect_x1 = x - padding
-        rect_y1 = y - text_size[1] - padding
-        rect_x2 = x + text_size[0] + padding
-        rect_y2 = y + padding
+        # Premultiply by opacity once, so each frame only needs
+        # roi * (1 - opacity) + sprite
+        sprite = cv2.convertScaleAbs(sprite, alpha=opacity)
         
-        # Ensure rectangle is within frame bounds
-        rect_x1 = max(0, rect_x1)
-        rect_y1 = max(0, rect_y1)
-        rect_x2 = min(frame.shape[1], rect_x2)
-        rect_y2 = min(frame.shape[0], rect_y2)
+        return sprite, (text_width, text_height)
+    
+    def _get_layout(self, frame_shape):
+        """
+        Place the sprite on a frame of the given shape, clipped to the frame bounds.
         
-        # Draw background rectangle with black color and opacity
-        cv2.rectangle(overlay, (rect_x1, rect_y1), (rect_x2, rect_y2), (0, 0, 0), -1)
+        Returns:
+            (frame_region, sprite, scratch) where frame_region is a (rows, cols)
+            slice tuple, sprite is the matching contiguous part of the sprite and
+            scratch is a reusable buffer of the same shape for blending
+        """
+        x, y = self._get_text_position(
+            frame_shape, self._text_size, self.watermark_config["position"], self.watermark_config["margin"]
+        )
+        
+        # Top-left corner of the sprite in frame coordinates
+        left = x - SPRITE_PADDING
+        top = y - self._text_size[1] - SPRITE_PADDING
+        sprite_height, sprite_width = self._sprite.shape[:2]
         
-        # Draw the text
-        cv2.putText(overlay, text, (x, y), font, font_scale, color, thickness)
+        # Ensure the sprite is within frame bounds
+        x1 = max(0, left)
+        y1 = max(0, top)
+        x2 = max(x1, min(frame_shape[1], left + sprite_width))
+        y2 = max(y1, min(frame_shape[0], top + sprite_height))
         
-        return overlay
+        sprite = np.ascontiguousarray(self._sprite[y1 - top:y2 - top, x1 - left:x2 - left])
+        return (slice(y1, y2), slice(x1, x2)), sprite, np.empty_like(sprite)
     
-    def apply_watermark(self, frame):
-        """Apply watermark to a frame if enabled."""
-        if not self.watermark_config["enabled"]:
+    def _apply_watermark_gpu(self, frame, inplace):
+        """Apply the watermark to a cv2.cuda_GpuMat frame without downloading it."""
+        width, height = frame.size()
+        frame_shape = (height, width, frame.channels())
+        
+        layout = self._layout_cache.get(frame_shape)
+        if layout is None:
+            layout = self._get_layout(frame_shape)
+            self._layout_cache[frame_shape] = layout
+        
+        frame_region, sprite, _ = layout
+        if not sprite.size:
             return frame
         
-        # Update config in case it changed
-        self.update_config()
+        # The sprite is constant, so upload it once per layout
+        gpu_sprite = self._gpu_sprite_cache.get(frame_shape)
+        if gpu_sprite is None:
+            gpu_sprite = cv2.cuda_GpuMat()
+            gpu_sprite.upload(sprite)
+            self._gpu_sprite_cache[frame_shape] = gpu_sprite
         
-        # Extract watermark settings
-        text = self.watermark_config["text"]
-        position = self.watermark_config["position"]
-        opacity = self.watermark_config["opacity"]
-        font_scale = self.watermark_config["font_scale"]
-        thickness = self.watermark_config["thickness"]
-        color = tuple(self.watermark_config["color"])
-        margin = self.watermark_config["margin"]
-        
-        # Create watermark overlay
-        overlay = self._create_watermark_overlay(
-            frame, text, position, opacity, font_scale, thickness, color, margin
-        )
+        watermarked_frame = frame if inplace else frame.clone()
+        rows, cols = frame_region
+        roi = cv2.cuda_GpuMat(watermarked_frame, (rows.start, rows.stop), (cols.start, cols.stop))
+        cv2.cuda.addWeighted(roi, self._background_weight, gpu_sprite, 1.0, 0, dst=roi)
+        
+        return watermarked_frame
+    
+    def apply_watermark(self, frame, inplace=False):
+        """
+        Apply watermark to a frame if enabled.
+        
+        Args:
+            frame: BGR frame (numpy array, or cv2.cuda_GpuMat on CUDA builds)
+            inplace: If True, draw onto the given frame instead of a copy.
+                The frame is then mutated, which avoids allocating a new frame
+                per call; callers that own their frames should prefer it.
+            
+        Returns:
+            The watermarked frame
+        """
+        # Watermarks are usually off, so keep that path to a single attribute read
+        if not self._enabled:
+            return frame
+        
+        # Frames already on the GPU are blended there rather than downloaded
+        if CUDA_AVAILABLE and isinstance(frame, cv2.cuda_GpuMat):
+            return self._apply_watermark_gpu(frame, inplace)
+        
+        # The placement only depends on the frame shape once the config is fixed
+        layout = self._layout_cache.get(frame.shape)
+        if layout is None:
+            layout = self._get_layout(frame.shape)
+            self._layout_cache[frame.shape] = layout
         
-        # Blend the overlay with the original frame
-        alpha = opacity
-        beta = 1.0 - alpha
-        gamma = 0
+        frame_region, sprite, scratch = layout
         
-        watermarked_frame = cv2.addWeighted(frame, beta, overlay, alpha, gamma)
+        # Only the watermark region is touched, so skip the full-frame copy when allowed
+        watermarked_frame = frame if inplace else frame.copy()
+        
+        # Blend the premultiplied sprite onto its region
+        roi = watermarked_frame[frame_region]
+        if roi.size:
+            blend_roi(roi, sprite, self._background_weight, scratch)
         
         return watermarked_frame
     
     def is_enabled(self):
         """Check if watermark is enabled."""
-        self.update_config()
-        return self.watermark_config["enabled"]
+        return self._enabled
+
+class WatermarkWorker(threading.Thread):
+    """
+    Applies the watermark on a background thread and hands each frame to a sink.
+    
+    Frames are watermarked in place, so callers must not reuse a submitted
+    frame until the worker has passed it on. OpenCV and pipe writes release
+    the GIL, which lets this overlap with decoding on the calling thread.
+    """
+    
+    def __init__(self, sink, renderer=None, maxsize=8):
+        super().__init__(daemon=True)
+        self.sink = sink
+        self.renderer = renderer if renderer is not None else watermark_renderer
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.error = None
+    
+    def submit(self, frame):
+        """Queue a frame, re-raising any error the worker has hit so far."""
+        if self.error is not None:
+            raise self.error
+        self.queue.put(frame)
+    
+    def run(self):
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                break
+            # After an error keep draining, so submit() never blocks forever
+            if self.error is None:
+                try:
+                    self.sink(self.renderer.apply_watermark(frame, inplace=True))
+                except Exception as e:
+                    self.error = e
+    
+    def stop(self):
+        """Wait for all queued frames to be handled and stop the thread."""
+        if self.is_alive():
+            self.queue.put(None)
+            self.join()
+    
+    def close(self):
+        """Stop the worker and re-raise any error it hit."""
+        self.stop()
+        if self.error is not None:
+            raise self.error
 
 # Global watermark renderer instance
 watermark_renderer = WatermarkRenderer() 
\ No newline at end of file
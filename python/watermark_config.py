@@ -10,6 +10,20 @@ import argparse
 import sys
 from config import config
 
+# Argument name -> (config key, validator, error message, confirmation) for each
+# value-setting option; the confirmation is formatted with the new value
+FIELDS = {
+    "text": ("watermark.text", None, None, "Watermark text set to: {}"),
+    "position": ("watermark.position", None, None, "Watermark position set to: {}"),
+    "opacity": ("watermark.opacity", lambda v: 0.0 <= v <= 1.0, "Opacity must be between 0.0 and 1.0",
+                "Watermark opacity set to: {}"),
+    "font_scale": ("watermark.font_scale", None, None, "Font scale set to: {}"),
+    "thickness": ("watermark.thickness", None, None, "Text thickness set to: {}"),
+    "margin": ("watermark.margin", None, None, "Margin set to: {} pixels"),
+    "color": ("watermark.color", lambda v: all(0 <= c <= 255 for c in v), "Color values must be between 0 and 255",
+              "Text color set to: RGB({0[0]}, {0[1]}, {0[2]})"),
+}
+
 def main():
     parser = argparse.ArgumentParser(description='Configure watermark settings for Reframer')
     parser.add_argument('--enable', action='store_true', help='Enable watermark')
@@ -38,64 +52,38 @@ def main():
     
     if args.reset:
         # Reset to default configuration
-        config.set("watermark.enabled", False)
-        config.set("watermark.text", "BETA")
-        config.set("watermark.position", "bottom-right")
-        config.set("watermark.opacity", 0.3)
-        config.set("watermark.font_scale", 1.0)
-        config.set("watermark.thickness", 2)
-        config.set("watermark.color", [255, 255, 255])
-        config.set("watermark.margin", 20)
+        defaults = config.reset_defaults("watermark")
         print("Watermark configuration reset to defaults")
+        for key, value in defaults.items():
+            print(f"  {key}: {value}")
         return
     
-    # Apply changes
+    # Collect changes, with a confirmation for each
+    changes = {}
+    confirmations = []
     if args.enable:
-        config.set_watermark_enabled(True)
-        print("Watermark enabled")
-    
+        changes["watermark.enabled"] = True
+        confirmations.append("Watermark enabled")
     if args.disable:
-        config.set_watermark_enabled(False)
-        print("Watermark disabled")
-    
-    if args.text is not None:
-        config.set_watermark_text(args.text)
-        print(f"Watermark text set to: {args.text}")
-    
-    if args.position is not None:
-        config.set_watermark_position(args.position)
-        print(f"Watermark position set to: {args.position}")
-    
-    if args.opacity is not None:
-        if not 0.0 <= args.opacity <= 1.0:
-            print("Error: Opacity must be between 0.0 and 1.0")
-            sys.exit(1)
-        config.set_watermark_opacity(args.opacity)
-        print(f"Watermark opacity set to: {args.opacity}")
-    
-    if args.font_scale is not None:
-        config.set("watermark.font_scale", args.font_scale)
-        print(f"Font scale set to: {args.font_scale}")
-    
-    if args.thickness is not None:
-        config.set("watermark.thickness", args.thickness)
-        print(f"Text thickness set to: {args.thickness}")
-    
-    if args.margin is not None:
-        config.set("watermark.margin", args.margin)
-        print(f"Margin set to: {args.margin} pixels")
+        changes["watermark.enabled"] = False
+        confirmations.append("Watermark disabled")
     
-    if args.color is not None:
-        r, g, b = args.color
-        if not all(0 <= c <= 255 for c in [r, g, b]):
-            print("Error: Color values must be between 0 and 255")
+    # Single pass over the parsed arguments, keeping only the known fields that were given
+    for arg_name, value in vars(args).items():
+        if value is None or arg_name not in FIELDS:
+            continue
+        config_key, validator, error, confirmation = FIELDS[arg_name]
+        if validator is not None and not validator(value):
+            print(f"Error: {error}")
             sys.exit(1)
-        config.set("watermark.color", [r, g, b])
-        print(f"Text color set to: RGB({r}, {g}, {b})")
+        changes[config_key] = value
+        confirmations.append(confirmation.format(value))
     
-    # Show final configuration if any changes were made
-    if any([args.enable, args.disable, args.text, args.position, args.opacity, 
-            args.font_scale, args.thickness, args.margin, args.color]):
+    # Apply all changes with a single write, then show the final configuration
+    if changes:
+        config.set_many(changes)
+        for confirmation in confirmations:
+            print(confirmation)
         print("\nUpdated watermark configuration:")
         watermark_config = config.get_watermark_config()
         for key, value in watermark_config.items():
@@ -0,0 +1,15 @@
+"""
+Lightweight stand-ins for ultralytics result objects.
+
+Plain namedtuples instead of Mock chains, so detector tests (and benchmarks
+built on them) don't pay for Mock attribute dispatch.
+"""
+
+from collections import namedtuple
+
+# Class names used by the fake results (subset of COCO)
+FAKE_NAMES = {0: 'person', 1: 'bicycle', 2: 'car'}
+
+# `data` holds rows of [x1, y1, x2, y2, confidence, class_id]
+FakeBoxes = namedtuple('FakeBoxes', ['data'])
+FakeResults = namedtuple('FakeResults', ['boxes', 'names'], defaults=[FAKE_NAMES])
@@ -7,17 +7,20 @@ import os
 import sys
 import tempfile
 import shutil
+import subprocess
+import importlib.util
 from pathlib import Path
 
-# Add the python directory to the path so we can import our modules
+# Add the python directory to the path so we can import our modules. With
+# --import-mode=importlib pytest leaves sys.path alone, so the project root is
+# added too, for the shared `tests` helpers
 sys.path.insert(0, str(Path(__file__).parent.parent / 'python'))
+sys.path.append(str(Path(__file__).parent.parent))
 
 @pytest.fixture(scope="session")
-def test_data_dir():
-    """Provide a temporary directory for test data."""
-    temp_dir = tempfile.mkdtemp(prefix="reframer_test_")
-    yield temp_dir
-    shutil.rmtree(temp_dir, ignore_errors=True)
+def test_data_dir(tmp_path_factory):
+    """Provide a temporary directory for test data (one per xdist worker)."""
+    return str(tmp_path_factory.mktemp("reframer_test_"))
 
 @pytest.fixture(scope="session")
 def sample_video_path():
@@ -31,11 +34,52 @@ def sample_video_path():
     return None
 
 @pytest.fixture(scope="session")
-def output_dir():
-    """Provide a temporary directory for test outputs."""
-    temp_dir = tempfile.mkdtemp(prefix="reframer_output_")
-    yield temp_dir
-    shutil.rmtree(temp_dir, ignore_errors=True)
+def tiny_clip(tmp_path_factory, ffmpeg_path):
+    """Provide a synthetic 1 second 64x64 test clip, generated once per session."""
+    clip_path = tmp_path_factory.mktemp("clips") / "tiny_clip.mp4"
+    try:
+        subprocess.run(
+            [ffmpeg_path, '-y', '-loglevel', 'error',
+             '-f', 'lavfi', '-i', 'testsrc=duration=1:size=64x64:rate=10',
+             '-pix_fmt', 'yuv420p', str(clip_path)],
+            check=True, capture_output=True, timeout=60
+        )
+    except (OSError, subprocess.SubprocessError) as e:
+        pytest.skip(f"Could not generate test clip with ffmpeg: {e}")
+    return str(clip_path)
+
+@pytest.fixture(scope="session", autouse=True)
+def _warm_detector():
+    """
+    Opt-in: with REFRAMER_WARM_DETECTOR=1, import ultralytics/torch and load the
+    nano YOLO weights at session start, so their cold start isn't charged to
+    whichever test touches them first. Never downloads; does nothing when the
+    weights aren't already under models/.
+    """
+    if not os.environ.get('REFRAMER_WARM_DETECTOR') or importlib.util.find_spec("ultralytics") is None:
+        return
+    from filelock import FileLock
+    import object_detector
+    
+    # Same relative path the detector loads, so the cached model is reused
+    model_path = os.path.join('models', object_detector.ObjectDetector._MODEL_NAME['n'])
+    if not os.path.exists(model_path):
+        return
+    # xdist workers load one at a time rather than all hitting the disk at once
+    with FileLock(os.path.join(tempfile.gettempdir(), 'reframer_warm_detector.lock')):
+        object_detector._load_yolo(model_path)
+
+@pytest.fixture(scope="session")
+def yolo_detector():
+    """Provide one ObjectDetector for the session, so the YOLO model is loaded once."""
+    pytest.importorskip("ultralytics")
+    from object_detector import ObjectDetector
+    return ObjectDetector(confidence_threshold=0.3, model_size='n', classes=[0], debug=False, input_video_path=None)
+
+@pytest.fixture(scope="session")
+def output_dir(tmp_path_factory):
+    """Provide a temporary directory for test outputs (one per xdist worker)."""
+    return str(tmp_path_factory.mktemp("reframer_output_"))
 
 @pytest.fixture(scope="function")
 def debug_dir():
@@ -49,22 +93,65 @@ def models_dir():
     """Provide the models directory path."""
     return str(Path(__file__).parent.parent / "models")
 
+@pytest.fixture(scope="session")
+def ffmpeg_cache_dir():
+    """Provide a per-user ffmpeg install directory shared by test sessions and xdist workers."""
+    cache_dir = Path.home() / ".cache" / "reframer" / "ffmpeg"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+@pytest.fixture(scope="session")
+def ffmpeg_path(ffmpeg_cache_dir):
+    """Provide the resolved ffmpeg path, installed into the shared cache at most once."""
+    from filelock import FileLock
+    from ffmpeg_manager import FFmpegManager
+    
+    # Only one worker at a time may download into the shared cache; the others
+    # then find the installed binary and skip the download
+    with FileLock(str(ffmpeg_cache_dir / ".lock")):
+        return FFmpegManager(ffmpeg_dir=ffmpeg_cache_dir).get_ffmpeg_path()
+
 @pytest.fixture(scope="session")
 def python_dir():
     """Provide the python backend directory path."""
     return str(Path(__file__).parent.parent / "python")
 
+@pytest.fixture(scope="session")
+def mainmod():
+    """Provide the main module, imported (with its detector dependencies) once per session."""
+    import main
+    return main
+
+@pytest.fixture(scope="session")
+def vpmod():
+    """Provide the video_processor module, imported once per session."""
+    import video_processor
+    return video_processor
+
+@pytest.fixture(scope="session")
+def arg_parser(mainmod):
+    """Provide the main.py command line parser, built once per session."""
+    return mainmod._build_parser()
+
 def pytest_configure(config):
     """Configure pytest with custom markers."""
     config.addinivalue_line(
-        "markers", "slow: marks tests as slow (deselect with '-m \"not slow\"')"
+        "markers", "slow: marks tests as slow (deselected by default; select with '-m slow')"
     )
     config.addinivalue_line(
-        "markers", "integration: marks tests as integration tests"
+        "markers", "integration: marks tests as integration tests (deselected by default; select with '-m integration')"
     )
     config.addinivalue_line(
         "markers", "unit: marks tests as unit tests"
     )
     config.addinivalue_line(
         "markers", "requires_video: marks tests that require a sample video file"
-    ) 
\ No newline at end of file
+    )
+    config.addinivalue_line(
+        "markers", "serial: marks tests that should not share the machine with xdist workers (run with '-n 0 -m serial')"
+    )
+
+def pytest_runtest_setup(item):
+    """Skip tests that run the full pipeline when its heavy dependencies are missing."""
+    if item.get_closest_marker("requires_video") is not None:
+        pytest.importorskip("ultralytics")
@@ -39,13 +39,15 @@ def run_tests(test_type='all', coverage=False, verbose=False, parallel=False, ou
     # Add test directory
     cmd.append(str(test_dir))
     
-    # Add markers based on test type
-    if test_type == 'unit':
+    # Add markers based on test type; pytest.ini skips slow and integration tests unless overridden
+    if test_type == 'all':
+        cmd.extend(['-m', ''])
+    elif test_type == 'unit':
         cmd.extend(['-m', 'unit'])
     elif test_type == 'integration':
         cmd.extend(['-m', 'integration'])
     elif test_type == 'fast':
-        cmd.extend(['-m', 'not slow'])
+        cmd.extend(['-m', 'not slow and not integration'])
     
     # Add coverage if requested
     if coverage:
@@ -55,15 +57,17 @@ def run_tests(test_type='all', coverage=False, verbose=False, parallel=False, ou
     if verbose:
         cmd.append('-v')
     
-    # Add parallel execution
+    # Add parallel execution; keep each file on one worker so module and
+    # class fixtures are not rebuilt on every worker
     if parallel:
-        cmd.extend(['-n', 'auto'])
+        cmd.extend(['-n', 'auto', '--dist=loadfile'])
     
     # Add output format
     if output_format == 'html':
         cmd.extend(['--html=test_results.html', '--self-contained-html'])
     elif output_format == 'json':
-        cmd.extend(['--json-report', '--json-report-file=test_results.json'])
+        cmd.extend(['--json-report', '--json-report-file=test_results.json',
+                    '--benchmark-json=benchmark_results.json'])
     
     # Add additional options
     cmd.extend([
@@ -50,11 +50,11 @@ def test_main_module():
     print("\nTesting main module import...")
     
     try:
-        from main import parse_args, main, process_keyframe
+        from main import parse_args, main, process_keyframes
         print("✅ Main module imported successfully")
         print(f"✅ parse_args function: {callable(parse_args)}")
         print(f"✅ main function: {callable(main)}")
-        print(f"✅ process_keyframe function: {callable(process_keyframe)}")
+        print(f"✅ process_keyframes function: {callable(process_keyframes)}")
         return True
     except ImportError as e:
         print(f"❌ Main module import failed: {e}")
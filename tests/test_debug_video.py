@@ -5,8 +5,10 @@ Test script to verify the new debug video functionality in ObjectDetector using
 
 import cv2
 import os
+import pytest
 from python.object_detector import ObjectDetector
 
+@pytest.mark.slow
 def test_debug_video_with_real_video():
     """Test the debug video functionality using landscape_10secs.mp4."""
     print("Testing debug video functionality with landscape_10secs.mp4...")
@@ -10,9 +10,19 @@ import shutil
 from pathlib import Path
 from unittest.mock import Mock, patch, MagicMock
 import subprocess
+import io
+import zipfile
 
 # Import the ffmpeg manager
-from ffmpeg_manager import get_ffmpeg_path, download_ffmpeg, FFmpegManager
+from ffmpeg_manager import get_ffmpeg_path, FFmpegManager, DOWNLOAD_CHUNK_SIZE
+
+
+@pytest.fixture(autouse=True)
+def clear_ffmpeg_path_cache():
+    """Make each test resolve ffmpeg afresh, so mocked managers are used."""
+    get_ffmpeg_path.cache_clear()
+    yield
+    get_ffmpeg_path.cache_clear()
 
 
 class TestFFmpegManagerInitialization:
@@ -37,283 +47,226 @@ class TestFFmpegManagerInitialization:
 
 
 class TestFFmpegManagerPathDetection:
-    """Test FFmpeg path detection functionality."""
-    
-    @patch('ffmpeg_manager.shutil.which')
-    def test_detect_system_ffmpeg_success(self, mock_which):
-        """Test successful detection of system FFmpeg."""
-        mock_which.return_value = '/usr/bin/ffmpeg'
-        
-        manager = FFmpegManager()
-        result = manager.detect_system_ffmpeg()
-        
-        assert result == '/usr/bin/ffmpeg'
-        mock_which.assert_called_once_with('ffmpeg')
-    
-    @patch('ffmpeg_manager.shutil.which')
-    def test_detect_system_ffmpeg_not_found(self, mock_which):
-        """Test detection when system FFmpeg is not found."""
-        mock_which.return_value = None
-        
-        manager = FFmpegManager()
-        result = manager.detect_system_ffmpeg()
-        
-        assert result is None
-        mock_which.assert_called_once_with('ffmpeg')
+    """Test FFmpeg executable verification."""
     
     @patch('ffmpeg_manager.subprocess.run')
-    def test_verify_ffmpeg_success(self, mock_run):
+    def test_check_ffmpeg_works_success(self, mock_run):
         """Test successful FFmpeg verification."""
         mock_run.return_value.returncode = 0
         mock_run.return_value.stdout = "ffmpeg version 4.2.7"
         
         manager = FFmpegManager()
-        result = manager.verify_ffmpeg('/usr/bin/ffmpeg')
+        result = manager._check_ffmpeg_works('/usr/bin/ffmpeg')
         
         assert result is True
         mock_run.assert_called_once()
+        assert mock_run.call_args.args[0] == ['/usr/bin/ffmpeg', '-version']
     
     @patch('ffmpeg_manager.subprocess.run')
-    def test_verify_ffmpeg_failure(self, mock_run):
+    def test_check_ffmpeg_works_failure(self, mock_run):
         """Test FFmpeg verification failure."""
         mock_run.return_value.returncode = 1
         
         manager = FFmpegManager()
-        result = manager.verify_ffmpeg('/usr/bin/ffmpeg')
+        result = manager._check_ffmpeg_works('/usr/bin/ffmpeg')
         
         assert result is False
         mock_run.assert_called_once()
     
     @patch('ffmpeg_manager.subprocess.run')
-    def test_verify_ffmpeg_timeout(self, mock_run):
+    def test_check_ffmpeg_works_timeout(self, mock_run):
         """Test FFmpeg verification timeout."""
         mock_run.side_effect = subprocess.TimeoutExpired(['ffmpeg', '-version'], 10)
         
         manager = FFmpegManager()
-        result = manager.verify_ffmpeg('/usr/bin/ffmpeg')
+        result = manager._check_ffmpeg_works('/usr/bin/ffmpeg')
         
         assert result is False
 
 
+def _write_fake_ffmpeg_zip(url, filepath):
+    """Stand-in for _download_file that writes a zip holding a fake ffmpeg binary."""
+    with zipfile.ZipFile(filepath, 'w') as zip_ref:
+        zip_ref.writestr('ffmpeg-6.1.1/ffmpeg', b'fake_ffmpeg_binary')
+        zip_ref.writestr('ffmpeg-6.1.1/ffmpeg.exe', b'fake_ffmpeg_binary')
+
+
 class TestFFmpegManagerDownload:
-    """Test FFmpeg downloading functionality."""
+    """Test FFmpeg downloading and installation."""
     
-    @patch('ffmpeg_manager.requests.get')
-    @patch('ffmpeg_manager.zipfile.ZipFile')
-    def test_download_ffmpeg_success(self, mock_zipfile, mock_get):
-        """Test successful FFmpeg download."""
-        # Mock the download response
-        mock_response = Mock()
-        mock_response.content = b'fake_ffmpeg_content'
-        mock_get.return_value = mock_response
-        
-        # Mock the zip file
-        mock_zip = Mock()
-        mock_zipfile.return_value.__enter__.return_value = mock_zip
-        
+    @patch('ffmpeg_manager.FFmpegManager._check_ffmpeg_works', return_value=True)
+    @patch('ffmpeg_manager.FFmpegManager._download_file', side_effect=_write_fake_ffmpeg_zip)
+    def test_install_ffmpeg_success(self, mock_download, mock_check):
+        """Test that a downloaded archive is extracted and the executable installed."""
         with tempfile.TemporaryDirectory() as temp_dir:
             manager = FFmpegManager(ffmpeg_dir=temp_dir)
             
-            # Test download
-            result = manager.download_ffmpeg()
-            
-            # Verify download was attempted
-            mock_get.assert_called()
-            mock_zipfile.assert_called()
+            result = manager.install_ffmpeg()
             
-            # Verify result
-            assert result is True
+            mock_download.assert_called_once()
+            assert result == str(manager.ffmpeg_path)
+            assert manager.ffmpeg_path.read_bytes() == b'fake_ffmpeg_binary'
+            # The archive and the temporary extraction directory are cleaned up
+            assert os.listdir(temp_dir) == [manager.ffmpeg_path.name]
     
-    @patch('ffmpeg_manager.requests.get')
-    def test_download_ffmpeg_network_error(self, mock_get):
+    @patch('ffmpeg_manager.urllib.request.urlopen')
+    def test_install_ffmpeg_network_error(self, mock_urlopen):
         """Test FFmpeg download with network error."""
-        mock_get.side_effect = Exception("Network error")
+        mock_urlopen.side_effect = OSError("Network error")
         
         with tempfile.TemporaryDirectory() as temp_dir:
             manager = FFmpegManager(ffmpeg_dir=temp_dir)
             
-            # Test download
-            result = manager.download_ffmpeg()
+            with pytest.raises(OSError, match="Network error"):
+                manager.install_ffmpeg()
             
-            # Verify result
-            assert result is False
+            # get_ffmpeg_path falls back to the system ffmpeg instead
+            assert manager.get_ffmpeg_path() == 'ffmpeg'
     
-    @patch('ffmpeg_manager.requests.get')
-    @patch('ffmpeg_manager.zipfile.ZipFile')
-    def test_download_ffmpeg_extraction_error(self, mock_zipfile, mock_get):
+    @patch('ffmpeg_manager.FFmpegManager._download_file')
+    def test_install_ffmpeg_extraction_error(self, mock_download):
         """Test FFmpeg download with extraction error."""
-        # Mock the download response
-        mock_response = Mock()
-        mock_response.content = b'fake_ffmpeg_content'
-        mock_get.return_value = mock_response
-        
-        # Mock the zip file to raise an exception
-        mock_zipfile.side_effect = Exception("Extraction error")
+        mock_download.side_effect = lambda url, filepath: Path(filepath).write_bytes(b'not an archive')
         
         with tempfile.TemporaryDirectory() as temp_dir:
             manager = FFmpegManager(ffmpeg_dir=temp_dir)
             
-            # Test download
-            result = manager.download_ffmpeg()
+            with pytest.raises(ValueError, match="Unsupported archive format"):
+                manager.install_ffmpeg()
             
-            # Verify result
-            assert result is False
+            assert manager.get_ffmpeg_path() == 'ffmpeg'
 
 
-class TestFFmpegManagerGetPath:
-    """Test get_ffmpeg_path functionality."""
+class TestFFmpegManagerStreamingDownload:
+    """Test that downloads are streamed to disk in chunks."""
     
-    @patch('ffmpeg_manager.FFmpegManager')
-    def test_get_ffmpeg_path_system_available(self, mock_manager_class):
-        """Test get_ffmpeg_path when system FFmpeg is available."""
-        # Mock the manager
-        mock_manager = Mock()
-        mock_manager.detect_system_ffmpeg.return_value = '/usr/bin/ffmpeg'
-        mock_manager.verify_ffmpeg.return_value = True
-        mock_manager_class.return_value = mock_manager
+    @patch('ffmpeg_manager.urllib.request.urlopen')
+    def test_download_file_streams_in_chunks(self, mock_urlopen):
+        """Test that the response is copied chunk by chunk rather than read whole."""
+        payload = b'x' * (DOWNLOAD_CHUNK_SIZE * 4) + b'y'
+        response = Mock(wraps=io.BytesIO(payload))
+        mock_urlopen.return_value.__enter__.return_value = response
         
-        # Test get_ffmpeg_path
-        result = get_ffmpeg_path()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filepath = Path(temp_dir) / 'ffmpeg_archive.zip'
+            FFmpegManager()._download_file('https://example.com/ffmpeg.zip', filepath)
+            
+            assert filepath.read_bytes() == payload
         
-        # Verify result
-        assert result == '/usr/bin/ffmpeg'
+        # Every read asked for one chunk, never the whole body
+        assert response.read.call_count > 1
+        for call in response.read.call_args_list:
+            assert call.args == (DOWNLOAD_CHUNK_SIZE,)
+
+
+class TestFFmpegManagerExtraction:
+    """Test archive extraction from files and in-memory streams."""
+    
+    def test_extract_zip_from_file_object(self):
+        """Test that a zip can be extracted straight from a BytesIO stream."""
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zip_ref:
+            zip_ref.writestr('ffmpeg-6.1.1/ffmpeg', b'fake_ffmpeg_binary')
         
-        # Verify manager was called correctly
-        mock_manager.detect_system_ffmpeg.assert_called_once()
-        mock_manager.verify_ffmpeg.assert_called_once_with('/usr/bin/ffmpeg')
+        with tempfile.TemporaryDirectory() as temp_dir:
+            FFmpegManager()._extract_archive(archive, temp_dir)
+            
+            assert (Path(temp_dir) / 'ffmpeg-6.1.1' / 'ffmpeg').read_bytes() == b'fake_ffmpeg_binary'
+    
+    def test_extract_unsupported_archive(self):
+        """Test that data that is neither zip nor tar is rejected."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with pytest.raises(ValueError, match="Unsupported archive format"):
+                FFmpegManager()._extract_archive(io.BytesIO(b'not an archive'), temp_dir)
+
+
+class TestFFmpegManagerGetPath:
+    """Test get_ffmpeg_path functionality."""
     
+    @patch('ffmpeg_manager._ffmpeg_manager', None)
     @patch('ffmpeg_manager.FFmpegManager')
-    def test_get_ffmpeg_path_download_required(self, mock_manager_class):
-        """Test get_ffmpeg_path when download is required."""
-        # Mock the manager
-        mock_manager = Mock()
-        mock_manager.detect_system_ffmpeg.return_value = None  # No system FFmpeg
-        mock_manager.verify_ffmpeg.return_value = True
-        mock_manager.download_ffmpeg.return_value = True
-        mock_manager.ffmpeg_path = '/tmp/ffmpeg/ffmpeg'
-        mock_manager_class.return_value = mock_manager
+    def test_get_ffmpeg_path_uses_manager(self, mock_manager_class):
+        """Test that get_ffmpeg_path returns the path resolved by the manager."""
+        mock_manager_class.return_value.get_ffmpeg_path.return_value = '/tmp/ffmpeg/ffmpeg'
         
-        # Test get_ffmpeg_path
         result = get_ffmpeg_path()
         
-        # Verify result
         assert result == '/tmp/ffmpeg/ffmpeg'
-        
-        # Verify manager was called correctly
-        mock_manager.detect_system_ffmpeg.assert_called_once()
-        mock_manager.download_ffmpeg.assert_called_once()
-        mock_manager.verify_ffmpeg.assert_called_once_with('/tmp/ffmpeg/ffmpeg')
+        mock_manager_class.assert_called_once_with()
+        mock_manager_class.return_value.get_ffmpeg_path.assert_called_once()
     
+    @patch('ffmpeg_manager._ffmpeg_manager', None)
     @patch('ffmpeg_manager.FFmpegManager')
-    def test_get_ffmpeg_path_download_failed(self, mock_manager_class):
-        """Test get_ffmpeg_path when download fails."""
-        # Mock the manager
-        mock_manager = Mock()
-        mock_manager.detect_system_ffmpeg.return_value = None  # No system FFmpeg
-        mock_manager.download_ffmpeg.return_value = False  # Download failed
-        mock_manager_class.return_value = mock_manager
+    def test_get_ffmpeg_path_cached(self, mock_manager_class):
+        """Test that the path is only resolved once per process."""
+        mock_manager_class.return_value.get_ffmpeg_path.return_value = 'ffmpeg'
         
-        # Test get_ffmpeg_path
-        with pytest.raises(RuntimeError, match="Failed to download FFmpeg"):
-            get_ffmpeg_path()
+        assert get_ffmpeg_path() == 'ffmpeg'
+        assert get_ffmpeg_path() == 'ffmpeg'
         
-        # Verify manager was called correctly
-        mock_manager.detect_system_ffmpeg.assert_called_once()
-        mock_manager.download_ffmpeg.assert_called_once()
+        mock_manager_class.return_value.get_ffmpeg_path.assert_called_once()
 
 
 class TestFFmpegManagerPlatformDetection:
     """Test platform-specific functionality."""
     
+    @pytest.mark.parametrize("system,machine,expected", [
+        ('Darwin', 'x86_64', 'evermeet.cx'),
+        ('Darwin', 'arm64', 'evermeet.cx'),
+        ('Windows', 'AMD64', 'gyan.dev'),
+        ('Windows', 'ARM64', 'gyan.dev'),
+        ('Linux', 'x86_64', 'amd64-static'),
+        ('Linux', 'AMD64', 'amd64-static'),
+        ('Linux', 'aarch64', 'arm64-static'),
+    ])
     @patch('ffmpeg_manager.platform.system')
     @patch('ffmpeg_manager.platform.machine')
-    def test_get_download_url_macos(self, mock_machine, mock_system):
-        """Test download URL generation for macOS."""
-        mock_system.return_value = 'Darwin'
-        mock_machine.return_value = 'x86_64'
+    def test_get_download_url(self, mock_machine, mock_system, system, machine, expected):
+        """Test download URL selection for each supported platform."""
+        mock_system.return_value = system
+        mock_machine.return_value = machine
         
-        manager = FFmpegManager()
-        url = manager.get_download_url()
-        
-        assert 'macos' in url.lower()
-        assert 'x86_64' in url
-    
-    @patch('ffmpeg_manager.platform.system')
-    @patch('ffmpeg_manager.platform.machine')
-    def test_get_download_url_windows(self, mock_machine, mock_system):
-        """Test download URL generation for Windows."""
-        mock_system.return_value = 'Windows'
-        mock_machine.return_value = 'AMD64'
-        
-        manager = FFmpegManager()
-        url = manager.get_download_url()
+        url = FFmpegManager()._get_ffmpeg_url()
         
-        assert 'windows' in url.lower()
-        assert 'amd64' in url
+        assert expected in url
     
     @patch('ffmpeg_manager.platform.system')
     @patch('ffmpeg_manager.platform.machine')
-    def test_get_download_url_linux(self, mock_machine, mock_system):
-        """Test download URL generation for Linux."""
-        mock_system.return_value = 'Linux'
-        mock_machine.return_value = 'x86_64'
-        
-        manager = FFmpegManager()
-        url = manager.get_download_url()
-        
-        assert 'linux' in url.lower()
-        assert 'x86_64' in url
-    
-    @patch('ffmpeg_manager.platform.system')
-    def test_get_download_url_unsupported_platform(self, mock_system):
-        """Test download URL generation for unsupported platform."""
+    def test_get_download_url_unsupported_platform(self, mock_machine, mock_system):
+        """Test download URL selection for an unsupported platform."""
         mock_system.return_value = 'UnsupportedOS'
+        mock_machine.return_value = 'x86_64'
         
-        manager = FFmpegManager()
-        
-        with pytest.raises(NotImplementedError, match="Unsupported platform"):
-            manager.get_download_url()
+        with pytest.raises(RuntimeError, match="Unsupported platform"):
+            FFmpegManager()._get_ffmpeg_url()
 
 
 class TestFFmpegManagerIntegration:
     """Integration tests for FFmpegManager."""
     
     @pytest.mark.integration
-    def test_ffmpeg_manager_full_workflow(self):
-        """Test the full FFmpegManager workflow."""
-        with tempfile.TemporaryDirectory() as temp_dir:
-            manager = FFmpegManager(ffmpeg_dir=temp_dir)
-            
-            # Test system detection
-            system_ffmpeg = manager.detect_system_ffmpeg()
-            
-            # If system FFmpeg is available, test verification
-            if system_ffmpeg:
-                is_valid = manager.verify_ffmpeg(system_ffmpeg)
-                assert isinstance(is_valid, bool)
-            
-            # Test that manager can be created without errors
-            assert manager.ffmpeg_dir == Path(temp_dir)
-            assert manager.ffmpeg_path == Path(temp_dir) / "ffmpeg"
+    def test_ffmpeg_manager_full_workflow(self, ffmpeg_cache_dir, ffmpeg_path):
+        """Test the full FFmpegManager workflow against the shared install cache."""
+        manager = FFmpegManager(ffmpeg_dir=ffmpeg_cache_dir)
+        
+        # Test that manager can be created without errors
+        assert manager.ffmpeg_dir == ffmpeg_cache_dir
+        assert manager.ffmpeg_path.parent == ffmpeg_cache_dir
+        
+        # The session fixture already installed into the cache, or fell back to the system ffmpeg
+        if manager.ffmpeg_path.exists():
+            assert manager._check_ffmpeg_works(manager.ffmpeg_path)
     
     @pytest.mark.integration
-    def test_get_ffmpeg_path_integration(self):
+    def test_get_ffmpeg_path_integration(self, ffmpeg_path):
         """Test get_ffmpeg_path integration."""
-        try:
-            # This should either return a valid path or raise an exception
-            ffmpeg_path = get_ffmpeg_path()
-            
-            # If we get here, we should have a valid path
-            assert isinstance(ffmpeg_path, str)
-            assert len(ffmpeg_path) > 0
-            
-            # Test that the path exists (if it's a local path)
-            if os.path.exists(ffmpeg_path):
-                assert os.path.isfile(ffmpeg_path)
-                
-        except RuntimeError as e:
-            # It's okay if FFmpeg is not available and download fails
-            assert "Failed to download FFmpeg" in str(e)
+        # The session fixture resolved the path once; we should have a valid path
+        assert isinstance(ffmpeg_path, str)
+        assert len(ffmpeg_path) > 0
+        
+        # Test that the path exists (if it's a local path)
+        if os.path.exists(ffmpeg_path):
+            assert os.path.isfile(ffmpeg_path)
 
 
 class TestFFmpegManagerErrorHandling:
@@ -326,15 +279,13 @@ class TestFFmpegManagerErrorHandling:
     
     def test_ffmpeg_manager_permission_error(self):
         """Test FFmpegManager with permission error."""
-        # Create a read-only directory
-        with tempfile.TemporaryDirectory() as temp_dir:
-            os.chmod(temp_dir, 0o444)  # Read-only
-            
-            try:
-                with pytest.raises(PermissionError):
-                    FFmpegManager(ffmpeg_dir=temp_dir)
-            finally:
-                os.chmod(temp_dir, 0o755)  # Restore permissions
+        # Simulate an unwritable install directory without touching the filesystem;
+        # chmod is ignored for root and on Windows
+        manager = FFmpegManager()
+        with patch('ffmpeg_manager.Path.exists', return_value=False), \
+             patch('ffmpeg_manager.Path.mkdir', side_effect=PermissionError):
+            with pytest.raises(PermissionError):
+                manager.install_ffmpeg()
 
 
 if __name__ == "__main__":
@@ -8,9 +8,35 @@ import cv2
 from unittest.mock import Mock, patch, MagicMock
 import os
 import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Import the object detector
-from object_detector import ObjectDetector
+from object_detector import ObjectDetector, DetectionsBatch, _load_yolo, _local_model_path
+from tests._fakes import FakeBoxes, FakeResults
+
+
+@pytest.fixture(scope="module")
+def synthetic_frame():
+    """A blank 640x480 frame, shared by the tests (the mocked model never looks at pixels)."""
+    return np.zeros((480, 640, 3), dtype=np.uint8)
+
+
+@pytest.fixture(autouse=True)
+def clear_model_cache():
+    """Make each test load the model afresh, so the patched YOLO is used."""
+    _load_yolo.cache_clear()
+    _local_model_path.cache_clear()
+    yield
+    _load_yolo.cache_clear()
+    _local_model_path.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def no_model_download():
+    """Resolve weights to models/<name> without touching the disk or the network."""
+    with patch('object_detector._local_model_path', side_effect=lambda name: os.path.join('models', name)) as mock_path:
+        yield mock_path
 
 
 class TestObjectDetectorInitialization:
@@ -50,9 +76,17 @@ class TestObjectDetectorInitialization:
         
         detector = ObjectDetector(model_size='n')
         
-        # Verify YOLO was called with correct model name
-        mock_yolo.assert_called_once_with('yolov8n.pt')
+        # The model is only loaded on first access
+        mock_yolo.assert_not_called()
         assert detector.model == mock_model
+        
+        # Verify YOLO was called with the weights under models/
+        mock_yolo.assert_called_once_with(os.path.join('models', 'yolo11n.pt'))
+        
+        # A second detector of the same size reuses the cached model
+        second = ObjectDetector(model_size='n')
+        assert second.model is detector.model
+        mock_yolo.assert_called_once()
     
     @patch('object_detector.YOLO')
     def test_object_detector_different_model_sizes(self, mock_yolo):
@@ -62,29 +96,75 @@ class TestObjectDetectorInitialization:
         
         # Test different model sizes
         sizes = ['n', 's', 'm', 'l', 'x']
-        expected_models = ['yolov8n.pt', 'yolov8s.pt', 'yolov8m.pt', 'yolov8l.pt', 'yolov8x.pt']
+        expected_models = [os.path.join('models', f'yolo11{size}.pt') for size in sizes]
         
         for size, expected_model in zip(sizes, expected_models):
             mock_yolo.reset_mock()
             detector = ObjectDetector(model_size=size)
+            _ = detector.model
             mock_yolo.assert_called_once_with(expected_model)
+        
+        # Every size stays cached: new detectors of any size don't load it again
+        mock_yolo.reset_mock()
+        for size in sizes:
+            _ = ObjectDetector(model_size=size).model
+        mock_yolo.assert_not_called()
+
+    
+    @patch('object_detector.os.path.exists', return_value=True)
+    @patch('object_detector.torch.cuda.is_available', return_value=False)
+    @patch('object_detector.YOLO')
+    def test_tensorrt_ignored_without_gpu(self, mock_yolo, mock_cuda, mock_exists):
+        """Test that use_tensorrt falls back to the PyTorch weights on CPU."""
+        detector = ObjectDetector(use_tensorrt=True)
+        _ = detector.model
+        
+        mock_yolo.assert_called_once_with(os.path.join('models', 'yolo11n.pt'))
+        mock_yolo.return_value.export.assert_not_called()
+        assert detector.device == 'cpu'
+
+
+class TestLocalModelPath:
+    """Test resolving (and downloading) the model weights."""
+    
+    @patch('object_detector.urllib.request.urlretrieve')
+    def test_existing_weights_not_downloaded(self, mock_urlretrieve, tmp_path, monkeypatch):
+        """Test that weights already under models/ are used as they are."""
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / 'models').mkdir()
+        (tmp_path / 'models' / 'yolo11n.pt').write_bytes(b'weights')
+        
+        assert _local_model_path('yolo11n.pt') == os.path.join('models', 'yolo11n.pt')
+        mock_urlretrieve.assert_not_called()
+    
+    @patch('object_detector.urllib.request.urlretrieve')
+    def test_missing_weights_downloaded_once(self, mock_urlretrieve, tmp_path, monkeypatch):
+        """Test that missing weights are downloaded on first use and the path is cached."""
+        monkeypatch.chdir(tmp_path)
+        expected = os.path.join('models', 'yolo11s.pt')
+        
+        assert _local_model_path('yolo11s.pt') == expected
+        assert _local_model_path('yolo11s.pt') == expected
+        
+        mock_urlretrieve.assert_called_once()
+        url, path = mock_urlretrieve.call_args.args
+        assert url.endswith('/yolo11s.pt')
+        assert path == expected
+        assert (tmp_path / 'models').is_dir()
 
 
 class TestObjectDetectorDetection:
     """Test object detection functionality."""
     
     @patch('object_detector.YOLO')
-    def test_detect_basic(self, mock_yolo):
+    def test_detect_basic(self, mock_yolo, synthetic_frame):
         """Test basic object detection."""
-        # Create mock model and results
-        mock_model = Mock()
-        mock_results = Mock()
-        mock_results[0].boxes.data = np.array([
+        # Create mock model and fake results
+        fake = [FakeResults(FakeBoxes(np.array([
             [100, 100, 200, 200, 0.8, 0],  # x1, y1, x2, y2, conf, class_id
             [300, 300, 400, 400, 0.6, 1]   # x1, y1, x2, y2, conf, class_id
-        ])
-        mock_model.return_value = [mock_results]
-        mock_yolo.return_value = mock_model
+        ])))]
+        mock_yolo.return_value = Mock(return_value=fake)
         
         # Create detector
         detector = ObjectDetector(
@@ -92,96 +172,76 @@ class TestObjectDetectorDetection:
             classes=[0, 1]
         )
         
-        # Create test frame
-        frame = np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8)
-        
         # Test detection
-        detections = detector.detect(frame, top_n=2)
+        detections = detector.detect(synthetic_frame, top_n=2)
         
         # Verify results
         assert len(detections) == 2
-        assert detections[0]['bbox'] == [100, 100, 200, 200]
+        # Boxes come back as [x, y, width, height]
+        assert detections[0]['box'] == [100, 100, 100, 100]
         assert detections[0]['confidence'] == 0.8
         assert detections[0]['class_id'] == 0
-        assert detections[1]['bbox'] == [300, 300, 400, 400]
+        assert detections[1]['box'] == [300, 300, 100, 100]
         assert detections[1]['confidence'] == 0.6
         assert detections[1]['class_id'] == 1
     
     @patch('object_detector.YOLO')
-    def test_detect_confidence_filtering(self, mock_yolo):
+    def test_detect_confidence_filtering(self, mock_yolo, synthetic_frame):
         """Test that detections are filtered by confidence threshold."""
-        # Create mock model and results
-        mock_model = Mock()
-        mock_results = Mock()
-        mock_results[0].boxes.data = np.array([
+        # Create mock model and fake results
+        fake = [FakeResults(FakeBoxes(np.array([
             [100, 100, 200, 200, 0.8, 0],  # High confidence
             [300, 300, 400, 400, 0.3, 1]   # Low confidence (should be filtered)
-        ])
-        mock_model.return_value = [mock_results]
-        mock_yolo.return_value = mock_model
+        ])))]
+        mock_yolo.return_value = Mock(return_value=fake)
         
         # Create detector with high confidence threshold
         detector = ObjectDetector(confidence_threshold=0.5, classes=[0, 1])
         
-        # Create test frame
-        frame = np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8)
-        
         # Test detection
-        detections = detector.detect(frame, top_n=10)
+        detections = detector.detect(synthetic_frame, top_n=10)
         
         # Verify only high confidence detection is returned
         assert len(detections) == 1
         assert detections[0]['confidence'] == 0.8
     
     @patch('object_detector.YOLO')
-    def test_detect_class_filtering(self, mock_yolo):
+    def test_detect_class_filtering(self, mock_yolo, synthetic_frame):
         """Test that detections are filtered by class."""
-        # Create mock model and results
-        mock_model = Mock()
-        mock_results = Mock()
-        mock_results[0].boxes.data = np.array([
+        # Create mock model and fake results
+        fake = [FakeResults(FakeBoxes(np.array([
             [100, 100, 200, 200, 0.8, 0],  # Class 0 (person)
             [300, 300, 400, 400, 0.7, 2]   # Class 2 (car) - should be filtered
-        ])
-        mock_model.return_value = [mock_results]
-        mock_yolo.return_value = mock_model
+        ])))]
+        mock_yolo.return_value = Mock(return_value=fake)
         
         # Create detector that only tracks class 0
         detector = ObjectDetector(confidence_threshold=0.5, classes=[0])
         
-        # Create test frame
-        frame = np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8)
-        
         # Test detection
-        detections = detector.detect(frame, top_n=10)
+        detections = detector.detect(synthetic_frame, top_n=10)
         
         # Verify only class 0 detection is returned
         assert len(detections) == 1
         assert detections[0]['class_id'] == 0
     
     @patch('object_detector.YOLO')
-    def test_detect_top_n_limiting(self, mock_yolo):
+    def test_detect_top_n_limiting(self, mock_yolo, synthetic_frame):
         """Test that top_n parameter limits the number of detections."""
-        # Create mock model and results with many detections
-        mock_model = Mock()
-        mock_results = Mock()
-        mock_results[0].boxes.data = np.array([
+        # Create mock model and fake results with many detections
+        fake = [FakeResults(FakeBoxes(np.array([
             [100, 100, 200, 200, 0.9, 0],  # Highest confidence
             [200, 200, 300, 300, 0.8, 0],  # Second highest
             [300, 300, 400, 400, 0.7, 0],  # Third highest
             [400, 400, 500, 500, 0.6, 0],  # Fourth highest
-        ])
-        mock_model.return_value = [mock_results]
-        mock_yolo.return_value = mock_model
+        ])))]
+        mock_yolo.return_value = Mock(return_value=fake)
         
         # Create detector
         detector = ObjectDetector(confidence_threshold=0.5, classes=[0])
         
-        # Create test frame
-        frame = np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8)
-        
         # Test detection with top_n=2
-        detections = detector.detect(frame, top_n=2)
+        detections = detector.detect(synthetic_frame, top_n=2)
         
         # Verify only top 2 detections are returned
         assert len(detections) == 2
@@ -189,27 +249,234 @@ class TestObjectDetectorDetection:
         assert detections[1]['confidence'] == 0.8  # Second highest confidence
     
     @patch('object_detector.YOLO')
-    def test_detect_no_detections(self, mock_yolo):
+    def test_detect_no_detections(self, mock_yolo, synthetic_frame):
         """Test detection when no objects are found."""
         # Create mock model with no detections
-        mock_model = Mock()
-        mock_results = Mock()
-        mock_results[0].boxes.data = np.array([])  # No detections
-        mock_model.return_value = [mock_results]
-        mock_yolo.return_value = mock_model
+        fake = [FakeResults(FakeBoxes(np.array([])))]  # No detections
+        mock_yolo.return_value = Mock(return_value=fake)
         
         # Create detector
         detector = ObjectDetector()
         
-        # Create test frame
-        frame = np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8)
-        
         # Test detection
-        detections = detector.detect(frame, top_n=10)
+        detections = detector.detect(synthetic_frame, top_n=10)
         
         # Verify empty list is returned
         assert len(detections) == 0
 
+    
+    @patch('object_detector.YOLO')
+    def test_detect_stream_stride(self, mock_yolo):
+        """Test that detect_stream only runs the model on every stride-th frame."""
+        result = FakeResults(FakeBoxes(np.zeros((0, 6), dtype=np.float32)))
+        mock_model = Mock(side_effect=lambda frames, **kwargs: [result] * len(frames))
+        mock_yolo.return_value = mock_model
+        
+        detector = ObjectDetector(batch_size=1)
+        frames = [np.zeros((64, 64, 3), dtype=np.uint8) for _ in range(5)]
+        
+        detections = list(detector.detect_stream(frames, stride=2))
+        
+        # ceil(5 / 2) model calls, one detection list per frame
+        assert mock_model.call_count == 3
+        assert [list(d) for d in detections] == [[]] * 5
+    
+    @pytest.mark.parametrize("cuda_available, expected_half", [(True, True), (False, False)])
+    @patch('object_detector.YOLO')
+    def test_detect_half_precision_on_gpu_only(self, mock_yolo, cuda_available, expected_half):
+        """Test that FP16 inference is requested on a GPU and FP32 is kept on CPU."""
+        result = FakeResults(FakeBoxes(np.zeros((0, 6), dtype=np.float32)))
+        mock_model = Mock(return_value=[result])
+        mock_yolo.return_value = mock_model
+        
+        with patch('object_detector.torch.cuda.is_available', return_value=cuda_available):
+            detector = ObjectDetector(half=True)
+        detector.detect(np.zeros((64, 64, 3), dtype=np.uint8))
+        
+        assert detector.half is expected_half
+        assert mock_model.call_args.kwargs['half'] is expected_half
+
+class TestObjectDetectorBatchDetection:
+    """Test batched detection."""
+    
+    @staticmethod
+    def _fake_result(rows):
+        """Build a fake YOLO result whose boxes hold the given rows."""
+        return FakeResults(FakeBoxes(np.array(rows, dtype=np.float32)))
+    
+    @patch.object(ObjectDetector, '_initialize_model')
+    def test_detect_batch_chunks_frames(self, mock_init):
+        """Test that frames are passed to the model batch_size at a time."""
+        result = self._fake_result([[10, 10, 30, 40, 0.9, 0]])
+        
+        detector = ObjectDetector(confidence_threshold=0.5, classes=[0], batch_size=2)
+        detector.model = Mock(side_effect=lambda frames, **kwargs: [result] * len(frames))
+        
+        frames = np.zeros((5, 64, 64, 3), dtype=np.uint8)
+        detections = detector.detect_batch(frames, top_n=1)
+        
+        # ceil(5 / 2) model calls, one detection list per frame
+        assert detector.model.call_count == 3
+        assert len(detections) == 5
+        assert all(list(d) == [{'box': [10, 10, 20, 30], 'confidence': pytest.approx(0.9),
+                          'class_id': 0, 'class_name': 'person'}] for d in detections)
+    
+    @patch('object_detector.YOLO')
+    def test_shared_model_never_called_concurrently(self, mock_yolo):
+        """Test that detectors sharing one cached model take turns calling it."""
+        result = self._fake_result([[10, 10, 30, 40, 0.9, 0]])
+        active, overlaps = [], []
+        
+        def model(frames, **kwargs):
+            active.append(None)
+            overlaps.append(len(active))
+            time.sleep(0.001)
+            active.pop()
+            return [result] * len(frames)
+        mock_yolo.return_value = Mock(side_effect=model)
+        
+        detectors = [ObjectDetector(classes=[0], batch_size=1) for _ in range(4)]
+        _ = detectors[0].model  # loaded once, then shared through the cache
+        frames = np.zeros((8, 16, 16, 3), dtype=np.uint8)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            for detections in executor.map(lambda d: d.detect_batch(frames), detectors * 2):
+                assert len(detections) == 8
+        
+        mock_yolo.assert_called_once()
+        assert len(overlaps) == 64
+        assert max(overlaps) == 1
+    
+    @patch.object(ObjectDetector, '_initialize_model')
+    def test_detect_uses_batch_path(self, mock_init):
+        """Test that detect() returns the single-frame result of detect_batch()."""
+        result = self._fake_result([[10, 10, 30, 40, 0.9, 0], [0, 0, 5, 5, 0.2, 0]])
+        
+        detector = ObjectDetector(confidence_threshold=0.5, classes=[0])
+        detector.model = Mock(return_value=[result])
+        
+        detections = detector.detect(np.zeros((64, 64, 3), dtype=np.uint8), top_n=5)
+        
+        detector.model.assert_called_once()
+        assert len(detections) == 1
+        assert detections[0]['box'] == [10, 10, 20, 30]
+    
+    @patch.object(ObjectDetector, '_initialize_model')
+    def test_top_n_of_many_detections(self, mock_init):
+        """Test that top_n picks the most confident rows of a large result, in order."""
+        confidences = np.random.default_rng(0).permutation(np.linspace(0.51, 0.99, 50))
+        rows = [[20 * i, 0, 20 * i + 10, 10, c, 0] for i, c in enumerate(confidences)]  # No overlaps
+        
+        detector = ObjectDetector(confidence_threshold=0.5, classes=[0])
+        detector.model = Mock(return_value=[self._fake_result(rows)])
+        
+        detections = detector.detect(np.zeros((64, 64, 3), dtype=np.uint8), top_n=5)
+        
+        expected = np.sort(confidences)[::-1][:5]
+        assert [d['confidence'] for d in detections] == pytest.approx(expected.tolist())
+    
+    # Two clusters of overlapping boxes, more than 4 * top_n of them for top_n=1
+    _OVERLAPPING_ROWS = [
+        [100, 100, 200, 200, 0.9, 0],
+        [102, 101, 201, 203, 0.8, 0],  # Overlaps the first box
+        [300, 300, 400, 400, 0.85, 0],
+        [301, 299, 399, 401, 0.7, 0],  # Overlaps the third box
+        [98, 99, 199, 198, 0.6, 0],    # Overlaps the first box
+    ]
+    
+    @patch.object(ObjectDetector, '_initialize_model')
+    def test_overlapping_boxes_kept_by_default(self, mock_init):
+        """Test that without nms_iou the detections are returned unchanged, however many there are."""
+        detector = ObjectDetector(confidence_threshold=0.5, classes=[0])
+        detector.model = Mock(return_value=[self._fake_result(self._OVERLAPPING_ROWS)])
+        
+        assert detector.nms_iou is None
+        detections = detector.detect(np.zeros((64, 64, 3), dtype=np.uint8), top_n=0)
+        assert [d['confidence'] for d in detections] == pytest.approx([0.9, 0.85, 0.8, 0.7, 0.6])
+        
+        detections = detector.detect(np.zeros((64, 64, 3), dtype=np.uint8), top_n=2)
+        assert [d['box'] for d in detections] == [[100, 100, 100, 100], [300, 300, 100, 100]]
+    
+    @patch.object(ObjectDetector, '_initialize_model')
+    def test_overlapping_boxes_suppressed(self, mock_init):
+        """Test that opt-in NMS prunes overlapping boxes once there are many candidates."""
+        rows = self._OVERLAPPING_ROWS
+        detector = ObjectDetector(confidence_threshold=0.5, classes=[0], nms_iou=0.45)
+        detector.model = Mock(return_value=[self._fake_result(rows)])
+        
+        # 5 candidates > 4 * top_n, so NMS runs before the top_n selection
+        detections = detector.detect(np.zeros((64, 64, 3), dtype=np.uint8), top_n=1)
+        assert [d['box'] for d in detections] == [[100, 100, 100, 100]]
+        
+        # top_n=0 keeps every detection that survives NMS
+        detections = detector.detect(np.zeros((64, 64, 3), dtype=np.uint8), top_n=0)
+        assert [d['box'] for d in detections] == [[100, 100, 100, 100], [300, 300, 100, 100]]
+    
+    @patch.object(ObjectDetector, '_initialize_model')
+    def test_detect_batch_runs_on_detector_device(self, mock_init):
+        """Test that inference is asked to run on the detector's device."""
+        detector = ObjectDetector()
+        detector.model = Mock(return_value=[self._fake_result([])])
+        
+        detector.detect(np.zeros((64, 64, 3), dtype=np.uint8))
+        
+        assert detector.device in ('cuda', 'cpu')
+        assert detector.model.call_args.kwargs['device'] == detector.device
+
+    
+    @patch.object(ObjectDetector, '_initialize_model')
+    def test_tensor_results_filtered_before_copy(self, mock_init):
+        """Test that tensor boxes are filtered and ranked before leaving the device."""
+        torch = pytest.importorskip('torch')
+        result = FakeResults(FakeBoxes(torch.tensor([
+            [0, 0, 10, 10, 0.6, 0],
+            [5, 5, 25, 45, 0.95, 0],
+            [1, 1, 9, 9, 0.99, 1],   # Unwanted class
+            [2, 2, 8, 8, 0.3, 0],    # Below threshold
+            [3, 3, 13, 23, 0.8, 0],
+        ])))
+        
+        detector = ObjectDetector(confidence_threshold=0.5, classes=[0])
+        detector.model = Mock(return_value=[result])
+        
+        detections = detector.detect(np.zeros((64, 64, 3), dtype=np.uint8), top_n=2)
+        
+        assert [d['box'] for d in detections] == [[5, 5, 20, 40], [3, 3, 10, 20]]
+        assert [d['class_name'] for d in detections] == ['person', 'person']
+
+
+class TestDetectionsBatch:
+    """Test the column-wise detection container."""
+    
+    def test_rows_read_as_detection_dicts(self):
+        """Test that indexing and iterating give the old detection dicts."""
+        batch = DetectionsBatch(
+            bboxes=np.array([[1, 2, 3, 4], [5, 6, 7, 8]], dtype=np.int32),
+            confidences=np.array([0.9, 0.6], dtype=np.float32),
+            class_ids=np.array([0, 2], dtype=np.int32),
+            names={0: 'person', 2: 'car'},
+        )
+        
+        assert len(batch) == 2
+        assert batch[1] == {'box': [5, 6, 7, 8], 'confidence': pytest.approx(0.6),
+                            'class_id': 2, 'class_name': 'car'}
+        assert [d['class_name'] for d in batch] == ['person', 'car']
+        assert list(batch)[0]['box'] == [1, 2, 3, 4]
+    
+    def test_with_boxes_keeps_selected_rows(self):
+        """Test that with_boxes keeps the chosen detections at their new boxes."""
+        batch = DetectionsBatch(
+            bboxes=np.array([[1, 2, 3, 4], [5, 6, 7, 8]], dtype=np.int32),
+            confidences=np.array([0.9, 0.6], dtype=np.float32),
+            class_ids=np.array([0, 2], dtype=np.int32),
+            names={0: 'person', 2: 'car'},
+        )
+        
+        moved = batch.with_boxes([1], [(10.7, 11.2, 7.0, 8.0)])
+        
+        assert moved.bboxes.tolist() == [[10, 11, 7, 8]]
+        assert moved.class_ids.tolist() == [2]
+        assert len(batch.with_boxes([], [])) == 0
+        assert len(DetectionsBatch.empty()) == 0
 
 class TestObjectDetectorDebug:
     """Test debug functionality."""
@@ -217,11 +484,10 @@ class TestObjectDetectorDebug:
     @patch('object_detector.YOLO')
     @patch('object_detector.cv2.VideoWriter')
     @patch('object_detector.os.makedirs')
-    def test_debug_video_creation(self, mock_makedirs, mock_video_writer, mock_yolo):
+    def test_debug_video_creation(self, mock_makedirs, mock_video_writer, mock_yolo, synthetic_frame):
         """Test debug video creation when debug mode is enabled."""
-        # Create mock model
-        mock_model = Mock()
-        mock_yolo.return_value = mock_model
+        # Create mock model with no detections
+        mock_yolo.return_value = Mock(return_value=[FakeResults(FakeBoxes(np.zeros((0, 6))))])
         
         # Create mock video writer
         mock_writer = Mock()
@@ -235,30 +501,49 @@ class TestObjectDetectorDebug:
         
         # Verify debug directory was created
         mock_makedirs.assert_called()
+        assert detector.debug_video_path.endswith('.mp4')
         
-        # Verify video writer was created
-        mock_video_writer.assert_called()
+        # The video writer is created lazily, sized from the first frame
+        mock_video_writer.assert_not_called()
+        detector.detect(synthetic_frame)
+        mock_video_writer.assert_called_once()
+        height, width = synthetic_frame.shape[:2]
+        assert mock_video_writer.call_args.args[3] == (width, height)
+        mock_writer.write.assert_called_once()
         
         # Test finalize_debug_video
         detector.finalize_debug_video()
         mock_writer.release.assert_called_once()
+        assert detector.debug_video_writer is None
     
     @patch('object_detector.YOLO')
-    def test_debug_disabled(self, mock_yolo):
+    @patch('object_detector.cv2.VideoWriter')
+    def test_debug_disabled(self, mock_video_writer, mock_yolo, synthetic_frame):
         """Test that debug functionality is disabled when debug=False."""
-        # Create mock model
-        mock_model = Mock()
-        mock_yolo.return_value = mock_model
+        mock_yolo.return_value = Mock(return_value=[FakeResults(FakeBoxes(np.zeros((0, 6))))])
         
         # Create detector with debug disabled
         detector = ObjectDetector(debug=False)
+        detector.detect(synthetic_frame)
         
-        # Verify debug attributes are None
+        # Verify no debug video was set up
         assert detector.debug_video_path is None
-        assert detector.debug_writer is None
+        assert detector.debug_video_writer is None
+        mock_video_writer.assert_not_called()
         
-        # Test finalize_debug_video (should not crash)
+        # Test finalize_debug_video (a no-op, should not crash)
         detector.finalize_debug_video()
+    
+    @patch.object(ObjectDetector, '_initialize_model')
+    def test_debug_hook_skipped_when_disabled(self, mock_init):
+        """Test that detection never calls the debug writer when debug=False."""
+        detector = ObjectDetector(debug=False)
+        detector.model = Mock(return_value=[FakeResults(FakeBoxes(np.zeros((0, 6))))])
+        
+        with patch.object(detector, '_debug_detections') as mock_debug:
+            detector.detect(np.zeros((64, 64, 3), dtype=np.uint8))
+        
+        mock_debug.assert_not_called()
 
 
 class TestObjectDetectorErrorHandling:
@@ -272,10 +557,10 @@ class TestObjectDetectorErrorHandling:
         
         # Test that exception is raised
         with pytest.raises(Exception, match="Model loading failed"):
-            ObjectDetector()
+            ObjectDetector().model
     
     @patch('object_detector.YOLO')
-    def test_detection_error(self, mock_yolo):
+    def test_detection_error(self, mock_yolo, synthetic_frame):
         """Test handling of detection errors."""
         # Create mock model that raises exception
         mock_model = Mock()
@@ -285,12 +570,9 @@ class TestObjectDetectorErrorHandling:
         # Create detector
         detector = ObjectDetector()
         
-        # Create test frame
-        frame = np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8)
-        
         # Test that detection error is handled
         with pytest.raises(Exception, match="Detection failed"):
-            detector.detect(frame)
+            detector.detect(synthetic_frame)
 
 
 if __name__ == "__main__":
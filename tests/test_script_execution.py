@@ -3,216 +3,256 @@ Simple test to verify that the main Python script can be executed.
 This is the initial test requested to check script execution.
 """
 
+import io
 import pytest
 import sys
 import os
 import subprocess
+from contextlib import ExitStack
 from pathlib import Path
-from unittest.mock import patch, Mock
+from types import SimpleNamespace
+from unittest.mock import patch
 
-# Import the main module
-from main import parse_args, main
+# Optional dependencies are probed once at collection; tests only check the flags
+try:
+    import cv2
+    _HAS_CV2 = True
+except ImportError:
+    _HAS_CV2 = False
 
+try:
+    import numpy as np
+    _HAS_NUMPY = True
+except ImportError:
+    _HAS_NUMPY = False
 
-class TestScriptExecution:
-    """Test that the main script can be executed."""
+try:
+    import ultralytics
+    _HAS_ULTRALYTICS = True
+except ImportError:
+    _HAS_ULTRALYTICS = False
+
+try:
+    import concurrent.futures
+    _HAS_CONCURRENT_FUTURES = True
+except ImportError:
+    _HAS_CONCURRENT_FUTURES = False
+
+_DEPENDENCIES = {
+    'cv2': _HAS_CV2,
+    'numpy': _HAS_NUMPY,
+    'ultralytics': _HAS_ULTRALYTICS,
+    'concurrent.futures': _HAS_CONCURRENT_FUTURES,
+}
+
+# A 1x1 black frame yielded for every keyframe by the mocked iter_frames_at
+_DUMMY_FRAME = np.zeros((1, 1, 3), dtype=np.uint8) if _HAS_NUMPY else None
+
+# Command line arguments for running main() end to end on mocked components
+_DEFAULT_ARGS = dict(
+    input='test_video.mp4',
+    output='test_output.mp4',
+    target_ratio=9/16,
+    max_workers=1,
+    batch_size=8,
+    detect_stride=1,
+    conf_threshold=0.5,
+    model_size='n',
+    object_classes=[0],
+    debug=False,
+    padding_ratio=0.1,
+    size_weight=0.4,
+    center_weight=0.3,
+    motion_weight=0.3,
+    history_weight=0.1,
+    saliency_weight=0.4,
+    face_detection=False,
+    weighted_center=False,
+    blend_saliency=False,
+    apply_smoothing=False,
+    smoothing_window=30,
+    position_inertia=0.8,
+    size_inertia=0.9,
+    skip_frames=30,
+    track_count=1,
+    watermark_enabled=None,
+    watermark_text=None,
+    watermark_position=None,
+    watermark_opacity=None,
+)
+
+
+@pytest.fixture
+def main_args():
+    """A fresh namespace of _DEFAULT_ARGS, safe for a test to modify."""
+    return SimpleNamespace(**_DEFAULT_ARGS)
+
+
+class _F:
+    """An already-completed future holding a value."""
     
-    def test_script_import(self):
-        """Test that the main script can be imported without errors."""
-        # This test will fail if there are import errors
-        assert True
+    def __init__(self, value):
+        self._value = value
     
-    def test_parse_args_function_exists(self):
-        """Test that the parse_args function exists and is callable."""
-        assert callable(parse_args)
+    def result(self):
+        return self._value
+
+
+class _SyncExec:
+    """Stand-in for ThreadPoolExecutor that runs submitted work inline."""
     
-    def test_main_function_exists(self):
-        """Test that the main function exists and is callable."""
-        assert callable(main)
-    
-    @patch('main.VideoProcessor')
-    @patch('main.ObjectDetector')
-    @patch('main.ObjectTracker')
-    @patch('main.CropCalculator')
-    @patch('main.CropWindowSmoother')
-    def test_main_function_can_be_called(self, mock_smoother, mock_calculator, 
-                                       mock_tracker, mock_detector, mock_processor):
-        """Test that the main function can be called without crashing."""
-        # Create mock arguments
-        args = Mock()
-        args.input = 'test_video.mp4'
-        args.output = 'test_output.mp4'
-        args.target_ratio = 9/16
-        args.max_workers = 1
-        args.conf_threshold = 0.5
-        args.model_size = 'n'
-        args.object_classes = [0]
-        args.debug = False
-        args.padding_ratio = 0.1
-        args.size_weight = 0.4
-        args.center_weight = 0.3
-        args.motion_weight = 0.3
-        args.history_weight = 0.1
-        args.saliency_weight = 0.4
-        args.face_detection = False
-        args.weighted_center = False
-        args.blend_saliency = False
-        args.apply_smoothing = False
-        args.smoothing_window = 30
-        args.position_inertia = 0.8
-        args.size_inertia = 0.9
-        args.skip_frames = 30
-        args.track_count = 1
+    def __init__(self, *args, **kwargs):
+        pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        return None
+    
+    def submit(self, fn, *args, **kwargs):
+        return _F(fn(*args, **kwargs))
+
+
+@pytest.fixture(scope="class")
+def pipeline_mocks():
+    """
+    Patch main's collaborators once per test class and wire them into a
+    minimal working pipeline over a 100-frame 1920x1080 video. Work submitted
+    to the executor runs inline. Call reset() after each test to clear the
+    recorded calls; the wired return values are kept.
+    """
+    with ExitStack() as stack:
+        stack.enter_context(patch('main.ThreadPoolExecutor', _SyncExec))
+        mocks = SimpleNamespace(
+            processor=stack.enter_context(patch('main.VideoProcessor')),
+            detector=stack.enter_context(patch('main.ObjectDetector')),
+            tracker=stack.enter_context(patch('main.ObjectTracker')),
+            calculator=stack.enter_context(patch('main.CropCalculator')),
+            smoother=stack.enter_context(patch('main.CropWindowSmoother')),
+        )
         
         # Mock video processor
-        mock_processor_instance = Mock()
-        mock_processor_instance.load_video.return_value = {
+        processor = mocks.processor.return_value
+        processor.load_video.return_value = {
             'total_frames': 100,
             'fps': 30.0,
             'width': 1920,
             'height': 1080
         }
-        mock_processor_instance.cap = Mock()
-        mock_processor_instance.cap.read.return_value = (True, Mock())
-        mock_processor_instance.cap.set.return_value = True
-        mock_processor_instance.generate_output_video.return_value = None
-        mock_processor.return_value = mock_processor_instance
-        
+        processor.iter_frames_at.side_effect = lambda indices: ((i, _DUMMY_FRAME) for i in indices)
+        processor.generate_output_video.return_value = None
+
         # Mock other components
-        mock_detector_instance = Mock()
-        mock_detector_instance.detect.return_value = []
-        mock_detector_instance.finalize_debug_video.return_value = None
-        mock_detector.return_value = mock_detector_instance
-        
-        mock_tracker_instance = Mock()
-        mock_tracker_instance.update.return_value = []
-        mock_tracker.return_value = mock_tracker_instance
-        
-        mock_calculator_instance = Mock()
-        mock_calculator_instance.calculate.return_value = [0, 0, 1920, 1080]
-        mock_calculator.return_value = mock_calculator_instance
+        mocks.detector.return_value.detect_batch.side_effect = lambda frames, top_n=1: [[] for _ in frames]
+        mocks.detector.return_value.finalize_debug_video.return_value = None
+        mocks.tracker.return_value.update.return_value = []
+        mocks.calculator.return_value.calculate.return_value = [0, 0, 1920, 1080]
+        mocks.smoother.return_value.smooth.return_value = [[0, 0, 1920, 1080]] * 100
         
-        mock_smoother_instance = Mock()
-        mock_smoother_instance.smooth.return_value = [[0, 0, 1920, 1080]] * 100
-        mock_smoother.return_value = mock_smoother_instance
+        def reset():
+            for mock in (mocks.processor, mocks.detector, mocks.tracker, mocks.calculator, mocks.smoother):
+                mock.reset_mock()
+        mocks.reset = reset
         
-        # Test that main function can be called without crashing
-        try:
-            with patch('main.ThreadPoolExecutor') as mock_executor:
-                mock_executor.return_value.__enter__.return_value.submit.return_value.result.return_value = 0
-                main(args)
-                assert True  # If we get here, the function ran successfully
-        except Exception as e:
-            pytest.fail(f"Main function failed to execute: {e}")
+        yield mocks
+
+
+class TestScriptExecution:
+    """Test that the main script can be executed."""
     
-    def test_script_has_required_imports(self):
-        """Test that the script has all required imports."""
-        # Check that key modules can be imported
-        try:
-            import cv2
-            import numpy as np
-            from concurrent.futures import ThreadPoolExecutor
-            assert True
-        except ImportError as e:
-            pytest.fail(f"Required import missing: {e}")
+    def test_script_import(self, mainmod):
+        """Test that the main script can be imported without errors."""
+        # The session fixture fails if there are import errors
+        assert mainmod is not None
+    
+    def test_parse_args_function_exists(self, mainmod):
+        """Test that the parse_args function exists and is callable."""
+        assert callable(mainmod.parse_args)
+    
+    def test_main_function_exists(self, mainmod):
+        """Test that the main function exists and is callable."""
+        assert callable(mainmod.main)
     
     def test_script_file_exists(self):
         """Test that the main script file exists."""
         script_path = Path(__file__).parent.parent / 'python' / 'main.py'
         assert script_path.exists(), f"Main script not found at {script_path}"
     
-    def test_script_is_executable(self):
+    def test_script_is_executable(self, arg_parser):
+        """Test that the script's command line interface produces help text."""
+        buf = io.StringIO()
+        arg_parser.print_help(buf)
+        text = buf.getvalue()
+        
+        assert text.startswith('usage:')
+        assert '--input' in text and '--output' in text
+    
+    @pytest.mark.slow
+    @pytest.mark.serial
+    def test_script_runs_as_subprocess(self):
         """Test that the script can be executed as a Python file."""
         script_path = Path(__file__).parent.parent / 'python' / 'main.py'
         
-        # Test that the file can be executed with Python
-        try:
-            result = subprocess.run(
-                [sys.executable, str(script_path), '--help'],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            # Should either show help or exit with error (but not crash)
-            assert result.returncode in [0, 1, 2]  # 0=success, 1=error, 2=usage error
-        except subprocess.TimeoutExpired:
-            pytest.fail("Script execution timed out")
-        except Exception as e:
-            pytest.fail(f"Script execution failed: {e}")
-
+        # Run with the normal sys.path (script directory and site-packages), as
+        # users do; only stderr is kept, to explain a failure.
+        # A hang surfaces as subprocess.TimeoutExpired
+        result = subprocess.run(
+            [sys.executable, str(script_path), '--help'],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            timeout=3
+        )
+        assert result.returncode == 0, result.stderr.decode(errors='replace')
 
 class TestScriptDependencies:
     """Test that script dependencies are available."""
     
-    def test_opencv_available(self):
-        """Test that OpenCV is available."""
-        try:
-            import cv2
-            assert cv2.__version__ is not None
-        except ImportError:
-            pytest.fail("OpenCV (cv2) is not available")
-    
-    def test_numpy_available(self):
-        """Test that NumPy is available."""
-        try:
-            import numpy as np
-            assert np.__version__ is not None
-        except ImportError:
-            pytest.fail("NumPy is not available")
-    
-    def test_ultralytics_available(self):
-        """Test that Ultralytics (YOLOv8) is available."""
-        try:
-            from ultralytics import YOLO
-            assert YOLO is not None
-        except ImportError:
-            pytest.fail("Ultralytics (YOLOv8) is not available")
+    @pytest.mark.parametrize("modname", ["cv2", "numpy", "ultralytics", "concurrent.futures"])
+    def test_dependency_available(self, modname):
+        """Test that a required module is available."""
+        assert _DEPENDENCIES[modname], f"{modname} is not available"
+
+
+class TestMainPipeline:
+    """Test running main() end to end on mocked components."""
     
-    def test_concurrent_futures_available(self):
-        """Test that concurrent.futures is available."""
+    def test_main_function_can_be_called(self, pipeline_mocks, main_args, mainmod):
+        """Test that the main function can be called without crashing."""
         try:
-            from concurrent.futures import ThreadPoolExecutor
-            assert ThreadPoolExecutor is not None
-        except ImportError:
-            pytest.fail("concurrent.futures is not available")
+            mainmod.main(main_args)
+        except Exception as e:
+            pytest.fail(f"Main function failed to execute: {e}")
+        else:
+            processor = pipeline_mocks.processor.return_value
+            assert processor.iter_frames_at.called
+            assert pipeline_mocks.detector.return_value.detect_batch.called
+            processor.generate_output_video.assert_called_once()
+            crop_windows = processor.generate_output_video.call_args.kwargs['crop_windows']
+            assert len(crop_windows) == 100
+        finally:
+            pipeline_mocks.reset()
 
 
 class TestScriptBasicFunctionality:
     """Test basic script functionality."""
     
-    def test_argument_parser_works(self):
+    def test_argument_parser_works(self, arg_parser):
         """Test that argument parsing works with basic arguments."""
-        test_args = [
-            '--input', 'test_video.mp4',
-            '--output', 'test_output.mp4'
-        ]
+        args = arg_parser.parse_args(['--input', 'test_video.mp4', '--output', 'test_output.mp4'])
         
-        with patch.object(sys, 'argv', ['main.py'] + test_args):
-            try:
-                args = parse_args()
-                assert args.input == 'test_video.mp4'
-                assert args.output == 'test_output.mp4'
-            except Exception as e:
-                pytest.fail(f"Argument parsing failed: {e}")
-    
-    def test_default_arguments_are_set(self):
+        assert args.input == 'test_video.mp4'
+        assert args.output == 'test_output.mp4'
+    
+    def test_default_arguments_are_set(self, arg_parser):
         """Test that default arguments are properly set."""
-        test_args = [
-            '--input', 'test_video.mp4',
-            '--output', 'test_output.mp4'
-        ]
+        args = arg_parser.parse_args(['--input', 'test_video.mp4', '--output', 'test_output.mp4'])
         
-        with patch.object(sys, 'argv', ['main.py'] + test_args):
-            try:
-                args = parse_args()
-                # Check some key defaults
-                assert args.target_ratio == 9/16
-                assert args.max_workers == 4
-                assert args.model_size == 'n'
-                assert args.conf_threshold == 0.5
-            except Exception as e:
-                pytest.fail(f"Default argument setting failed: {e}")
-
+        # Check some key defaults
+        assert args.target_ratio == 9/16
+        assert args.max_workers == 4
+        assert args.model_size == 'n'
+        assert args.conf_threshold == 0.5
 
 if __name__ == "__main__":
     pytest.main([__file__]) 
\ No newline at end of file
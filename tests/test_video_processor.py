@@ -2,62 +2,184 @@
 Tests for the video_processor.py module.
 """
 
+import itertools
 import pytest
 import numpy as np
 import cv2
-from unittest.mock import Mock, patch, MagicMock
+from unittest.mock import Mock, patch
 import os
-import tempfile
-import shutil
+import subprocess
+import threading
 
-# Import the video processor
-from video_processor import VideoProcessor
+
+# Properties of the mocked 100-frame, 30 fps, 1920x1080 capture. These are the
+# only properties VideoProcessor reads, so cap.get can be the dict's own get
+_PROPS = {
+    cv2.CAP_PROP_FRAME_COUNT: 100,
+    cv2.CAP_PROP_FPS: 30.0,
+    cv2.CAP_PROP_FRAME_WIDTH: 1920,
+    cv2.CAP_PROP_FRAME_HEIGHT: 1080
+}
+
+# Path of the mocked input video
+_FAKE_VIDEO = 'test_video.mp4'
+
+
+@pytest.fixture(scope="module")
+def blank_frame():
+    """A black 1920x1080 frame matching the mocked capture, allocated once per module."""
+    return np.zeros((1080, 1920, 3), dtype=np.uint8)
+
+
+@pytest.fixture(scope="module")
+def center_crops():
+    """100 center crops (x=480, y=270, w=960, h=540) of a 1920x1080 frame."""
+    return [[480, 270, 960, 540]] * 100
+
+
+@pytest.fixture(scope="module")
+def invalid_crop_windows():
+    """100 crop windows with negative coordinates."""
+    return [[-10, -10, 100, 100]] * 100
+
+
+@pytest.fixture(scope="module")
+def out_of_bounds_crop_windows():
+    """100 crop windows starting outside a 1920x1080 frame."""
+    return [[2000, 2000, 100, 100]] * 100
+
+
+@pytest.fixture(scope="class")
+def _video_capture_patch():
+    """Patch cv2.VideoCapture once per test class; yields the patch and the capture it returns."""
+    with patch('video_processor.cv2.VideoCapture') as mock_video_capture:
+        yield mock_video_capture, Mock()
+
+
+@pytest.fixture
+def mocked_video_capture(_video_capture_patch):
+    """
+    Provide (VideoCapture mock, capture mock), reset for each test to an
+    opened capture of a 100-frame, 30 fps, 1920x1080 video at _FAKE_VIDEO,
+    which is the only fake path that exists on disk. Tests override only
+    what they need, e.g. mock_cap.read.return_value.
+    """
+    mock_video_capture, mock_cap = _video_capture_patch
+    mock_video_capture.reset_mock(return_value=True, side_effect=True)
+    mock_cap.reset_mock(return_value=True, side_effect=True)
+    
+    mock_cap.isOpened.return_value = True
+    mock_cap.get.side_effect = _PROPS.get
+    mock_video_capture.return_value = mock_cap
+    
+    # Real paths (e.g. the output written by the fake ffmpeg) are still checked on disk
+    real_exists = os.path.exists
+    with patch('video_processor.os.path.exists', side_effect=lambda p: p == _FAKE_VIDEO or real_exists(p)):
+        yield mock_video_capture, mock_cap
+
+
+class _FakeStdin:
+    """The ffmpeg pipe: keeps a copy of every frame written to it."""
+    
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+    
+    def write(self, data):
+        self.chunks.append(bytes(data))
+    
+    def close(self):
+        self.closed = True
+
+
+class _FakeFFmpeg:
+    """
+    Stands in for the ffmpeg process. Unless killed, wait() creates the output
+    file (the last argument) and returns returncode.
+    """
+    
+    returncode = 0
+    
+    def __init__(self, cmd, stdin=None):
+        self.cmd = cmd
+        self.stdin = _FakeStdin()
+        self.killed = False
+    
+    def wait(self):
+        if self.killed:
+            return -9
+        with open(self.cmd[-1], 'wb') as f:
+            f.write(b'\0')
+        return self.returncode
+    
+    def kill(self):
+        self.killed = True
+
+
+@pytest.fixture
+def fake_ffmpeg():
+    """
+    Patch the ffmpeg subprocess and yield the list of fake processes started.
+    Frames are read through the OpenCV path and the watermark is off, so what
+    reaches stdin is exactly the cropped frames.
+    """
+    processes = []
+    
+    def popen(cmd, **kwargs):
+        processes.append(_FakeFFmpeg(cmd, **kwargs))
+        return processes[-1]
+    
+    with patch('video_processor.subprocess.Popen', side_effect=popen), \
+         patch('video_processor.get_ffmpeg_path', return_value='ffmpeg'), \
+         patch('video_processor.VideoDecoder', None), \
+         patch('watermark.watermark_renderer._enabled', False):
+        yield processes
+
+
+@pytest.fixture
+def encoding_processor(vpmod, tmp_path):
+    """A processor over a mocked 4-frame 64x48 capture; yields (processor, frames)."""
+    frames = [((np.arange(48 * 64 * 3).reshape(48, 64, 3) + i) % 256).astype(np.uint8) for i in range(4)]
+    processor = vpmod.VideoProcessor()
+    processor.cap = Mock()
+    processor.cap.read.side_effect = [(True, frame) for frame in frames] + [(False, None)]
+    processor.video_info = {
+        'width': 64, 'height': 48, 'fps': 30.0, 'total_frames': 4,
+        'path': str(tmp_path / 'input.mp4')
+    }
+    return processor, frames
 
 
 class TestVideoProcessorInitialization:
     """Test VideoProcessor initialization."""
     
-    def test_video_processor_init(self):
+    def test_video_processor_init(self, vpmod):
         """Test VideoProcessor initialization."""
-        processor = VideoProcessor()
+        processor = vpmod.VideoProcessor()
         
         assert processor.cap is None
-        assert processor.output_writer is None
-    
-    def test_video_processor_context_manager(self):
-        """Test VideoProcessor as context manager."""
-        with VideoProcessor() as processor:
-            assert processor.cap is None
-            assert processor.output_writer is None
+        assert processor.writer is None
+        # The crop thread pool is only started by the first apply_crop_batch call
+        assert processor._crop_executor is None
 
 
 class TestVideoProcessorVideoLoading:
     """Test video loading functionality."""
     
-    @patch('video_processor.cv2.VideoCapture')
-    def test_load_video_success(self, mock_video_capture):
+    def test_load_video_success(self, mocked_video_capture, vpmod):
         """Test successful video loading."""
-        # Create mock video capture
-        mock_cap = Mock()
-        mock_cap.isOpened.return_value = True
-        mock_cap.get.side_effect = lambda prop: {
-            cv2.CAP_PROP_FRAME_COUNT: 300,
-            cv2.CAP_PROP_FPS: 30.0,
-            cv2.CAP_PROP_FRAME_WIDTH: 1920,
-            cv2.CAP_PROP_FRAME_HEIGHT: 1080
-        }.get(prop, 0)
-        
-        mock_video_capture.return_value = mock_cap
+        mock_video_capture, mock_cap = mocked_video_capture
         
         # Create processor and load video
-        processor = VideoProcessor()
+        processor = vpmod.VideoProcessor()
         video_info = processor.load_video('test_video.mp4')
         
         # Verify video capture was created
-        mock_video_capture.assert_called_once_with('test_video.mp4')
+        mock_video_capture.assert_called_once()
+        assert mock_video_capture.call_args.args[0] == 'test_video.mp4'
         
         # Verify video info
-        assert video_info['total_frames'] == 300
+        assert video_info['total_frames'] == 100
         assert video_info['fps'] == 30.0
         assert video_info['width'] == 1920
         assert video_info['height'] == 1080
@@ -65,54 +187,61 @@ class TestVideoProcessorVideoLoading:
         # Verify cap is set
         assert processor.cap == mock_cap
     
-    @patch('video_processor.cv2.VideoCapture')
-    def test_load_video_failure(self, mock_video_capture):
+    def test_load_video_failure(self, mocked_video_capture, vpmod):
         """Test video loading failure."""
-        # Create mock video capture that fails to open
-        mock_cap = Mock()
+        _, mock_cap = mocked_video_capture
         mock_cap.isOpened.return_value = False
-        mock_video_capture.return_value = mock_cap
         
         # Create processor and attempt to load video
-        processor = VideoProcessor()
+        processor = vpmod.VideoProcessor()
         
         with pytest.raises(ValueError, match="Could not open video file"):
-            processor.load_video('nonexistent_video.mp4')
+            processor.load_video('test_video.mp4')
     
-    @patch('video_processor.cv2.VideoCapture')
-    def test_load_video_file_not_found(self, mock_video_capture):
+    def test_load_video_file_not_found(self, mocked_video_capture, vpmod):
         """Test video loading when file doesn't exist."""
-        # Make VideoCapture raise an exception
-        mock_video_capture.side_effect = Exception("File not found")
+        mock_video_capture, _ = mocked_video_capture
         
         # Create processor and attempt to load video
-        processor = VideoProcessor()
+        processor = vpmod.VideoProcessor()
         
-        with pytest.raises(Exception, match="File not found"):
+        with pytest.raises(FileNotFoundError, match="Video file not found"):
             processor.load_video('nonexistent_video.mp4')
+        mock_video_capture.assert_not_called()
 
+    
+    @patch('video_processor.platform.system', return_value='Linux')
+    @patch('video_processor.cv2.VideoCapture')
+    def test_open_capture_requests_hw_decode(self, mock_video_capture, mock_system, vpmod):
+        """Test that the FFmpeg backend is asked for hardware decoding."""
+        cap = vpmod._open_capture('test_video.mp4')
+        
+        assert cap is mock_video_capture.return_value
+        args = mock_video_capture.call_args.args
+        assert args[:2] == ('test_video.mp4', cv2.CAP_FFMPEG)
+        assert args[2][:2] == [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+    
+    @patch('video_processor.platform.system', return_value='Linux')
+    @patch('video_processor.cv2.VideoCapture')
+    def test_open_capture_falls_back_to_default_backend(self, mock_video_capture, mock_system, vpmod):
+        """Test that a capture that fails to open with HW decode is reopened plainly."""
+        hw_cap, plain_cap = Mock(), Mock()
+        hw_cap.isOpened.return_value = False
+        mock_video_capture.side_effect = [hw_cap, plain_cap]
+        
+        assert vpmod._open_capture('test_video.mp4') is plain_cap
+        assert mock_video_capture.call_args.args == ('test_video.mp4',)
 
 class TestVideoProcessorFrameReading:
     """Test frame reading functionality."""
     
-    @patch('video_processor.cv2.VideoCapture')
-    def test_read_frame_success(self, mock_video_capture):
+    def test_read_frame_success(self, mocked_video_capture, blank_frame, vpmod):
         """Test successful frame reading."""
-        # Create mock video capture
-        mock_cap = Mock()
-        mock_cap.isOpened.return_value = True
-        mock_cap.get.side_effect = lambda prop: {
-            cv2.CAP_PROP_FRAME_COUNT: 100,
-            cv2.CAP_PROP_FPS: 30.0,
-            cv2.CAP_PROP_FRAME_WIDTH: 640,
-            cv2.CAP_PROP_FRAME_HEIGHT: 480
-        }.get(prop, 0)
-        mock_cap.read.return_value = (True, np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8))
-        
-        mock_video_capture.return_value = mock_cap
+        _, mock_cap = mocked_video_capture
+        mock_cap.read.return_value = (True, blank_frame)
         
         # Create processor and load video
-        processor = VideoProcessor()
+        processor = vpmod.VideoProcessor()
         processor.load_video('test_video.mp4')
         
         # Read frame
@@ -121,26 +250,15 @@ class TestVideoProcessorFrameReading:
         # Verify frame was read
         assert ret is True
         assert frame is not None
-        assert frame.shape == (480, 640, 3)
+        assert frame.shape == (1080, 1920, 3)
     
-    @patch('video_processor.cv2.VideoCapture')
-    def test_read_frame_end_of_video(self, mock_video_capture):
+    def test_read_frame_end_of_video(self, mocked_video_capture, vpmod):
         """Test frame reading at end of video."""
-        # Create mock video capture
-        mock_cap = Mock()
-        mock_cap.isOpened.return_value = True
-        mock_cap.get.side_effect = lambda prop: {
-            cv2.CAP_PROP_FRAME_COUNT: 100,
-            cv2.CAP_PROP_FPS: 30.0,
-            cv2.CAP_PROP_FRAME_WIDTH: 640,
-            cv2.CAP_PROP_FRAME_HEIGHT: 480
-        }.get(prop, 0)
+        _, mock_cap = mocked_video_capture
         mock_cap.read.return_value = (False, None)  # End of video
         
-        mock_video_capture.return_value = mock_cap
-        
         # Create processor and load video
-        processor = VideoProcessor()
+        processor = vpmod.VideoProcessor()
         processor.load_video('test_video.mp4')
         
         # Read frame
@@ -151,185 +269,372 @@ class TestVideoProcessorFrameReading:
         assert frame is None
 
 
+    @patch('video_processor.VideoDecoder', None)
+    def test_iter_frames_reads_sequentially(self, vpmod):
+        """Test that the OpenCV fallback reads frames in order without seeking each one."""
+        processor = vpmod.VideoProcessor()
+        processor.cap = Mock()
+        frame = np.zeros((4, 4, 3), dtype=np.uint8)
+        processor.cap.read.side_effect = [(True, frame)] * 3 + [(False, None)]
+        
+        frames = list(processor._iter_frames(5))
+        
+        assert len(frames) == 3
+        processor.cap.set.assert_called_once_with(cv2.CAP_PROP_POS_FRAMES, 0)
+    
+    @pytest.mark.parametrize("width,height,batch_size", [
+        (1280, 720, 32),
+        (1920, 1080, 21),
+        (3840, 2160, 5),
+    ])
+    def test_iter_frames_decode_batches_sized_from_frames(self, vpmod, width, height, batch_size):
+        """Test that the batched decoder gets smaller batches for larger frames."""
+        torch = pytest.importorskip("torch")
+        ranges = []
+        
+        class FakeDecoder:
+            def __init__(self, path):
+                pass
+            
+            def __len__(self):
+                return 100
+            
+            def get_frames_in_range(self, start, stop):
+                ranges.append((start, stop))
+                return Mock(data=torch.zeros((stop - start, 3, 2, 2), dtype=torch.uint8))
+        
+        processor = vpmod.VideoProcessor()
+        processor.video_info = {'path': 'input.mp4', 'width': width, 'height': height}
+        
+        with patch('video_processor.VideoDecoder', FakeDecoder):
+            frames = list(processor._iter_frames(100))
+        
+        assert len(frames) == 100
+        assert max(stop - start for start, stop in ranges) == batch_size
+        assert ranges[-1][1] == 100
+    
+    def test_iter_frames_at_prefetches_keyframes(self, vpmod):
+        """Test that keyframes are read in order, grabbing through short gaps and seeking over long ones."""
+        processor = vpmod.VideoProcessor()
+        processor.cap = Mock()
+        frame = np.zeros((4, 4, 3), dtype=np.uint8)
+        processor.cap.read.return_value = (True, frame)
+        
+        frames = list(processor.iter_frames_at([0, 10, 100]))
+        
+        assert [frame_idx for frame_idx, _ in frames] == [0, 10, 100]
+        # Seek to the first keyframe and over the long gap; grab through the short one
+        assert processor.cap.set.call_args_list == [
+            ((cv2.CAP_PROP_POS_FRAMES, 0),),
+            ((cv2.CAP_PROP_POS_FRAMES, 100),),
+        ]
+        assert processor.cap.grab.call_count == 9
+
+
 class TestVideoProcessorOutputGeneration:
     """Test output video generation functionality."""
     
-    @patch('video_processor.cv2.VideoCapture')
-    @patch('video_processor.cv2.VideoWriter')
-    def test_generate_output_video(self, mock_video_writer, mock_video_capture):
-        """Test output video generation."""
-        # Create mock video capture
-        mock_cap = Mock()
-        mock_cap.isOpened.return_value = True
-        mock_cap.get.side_effect = lambda prop: {
-            cv2.CAP_PROP_FRAME_COUNT: 100,
-            cv2.CAP_PROP_FPS: 30.0,
-            cv2.CAP_PROP_FRAME_WIDTH: 1920,
-            cv2.CAP_PROP_FRAME_HEIGHT: 1080
-        }.get(prop, 0)
-        
-        # Create mock frames
-        mock_frames = []
-        for i in range(100):
-            frame = np.random.randint(0, 255, (1080, 1920, 3), dtype=np.uint8)
-            mock_frames.append(frame)
-        
-        mock_cap.read.side_effect = [(True, frame) for frame in mock_frames] + [(False, None)]
-        
-        mock_video_capture.return_value = mock_cap
-        
-        # Create mock video writer
-        mock_writer = Mock()
-        mock_video_writer.return_value = mock_writer
-        mock_writer.isOpened.return_value = True
+    @pytest.mark.parametrize("crops_fixture,returncode,size", [
+        ("center_crops", 0, (960, 540)),
+        ("center_crops", 1, (960, 540)),
+        ("invalid_crop_windows", 0, (100, 100)),
+        ("out_of_bounds_crop_windows", 0, (100, 100)),
+    ], ids=["center_crop", "ffmpeg_failure", "negative_crop", "out_of_bounds_crop"])
+    def test_generate_output_video(self, request, mocked_video_capture, blank_frame, fake_ffmpeg,
+                                   monkeypatch, tmp_path, crops_fixture, returncode, size, vpmod):
+        """Test output generation: frames piped to ffmpeg, crop clamping and ffmpeg failure."""
+        _, mock_cap = mocked_video_capture
+        # Ten frames are enough; every 1080p crop piped to the fake ffmpeg is kept in memory
+        crops = request.getfixturevalue(crops_fixture)[:10]
+        output_path = str(tmp_path / 'test_output.mp4')
+        monkeypatch.setattr(_FakeFFmpeg, 'returncode', returncode)
+        
+        # The same blank frame stands in for every frame; reads are generated lazily
+        mock_cap.read.side_effect = itertools.chain(
+            ((True, blank_frame) for _ in range(100)), [(False, None)]
+        )
         
-        # Create processor and load video
-        processor = VideoProcessor()
+        # Only the input video is faked on disk; the output is really written by the fake ffmpeg
+        processor = vpmod.VideoProcessor()
         processor.load_video('test_video.mp4')
         
-        # Create crop windows (simple center crop for testing)
-        crop_windows = []
-        for i in range(100):
-            # Center crop: x=480, y=270, w=960, h=540
-            crop_windows.append([480, 270, 960, 540])
-        
-        # Generate output video
-        processor.generate_output_video(
-            output_path='test_output.mp4',
-            crop_windows=crop_windows,
-            fps=30.0
-        )
-        
-        # Verify video writer was created
-        mock_video_writer.assert_called_once()
+        if returncode:
+            with pytest.raises(RuntimeError, match=f"FFmpeg exited with code {returncode}"):
+                processor.generate_output_video(output_path, crops, fps=30.0)
+            assert not os.path.exists(output_path)
+            return
+        
+        processor.generate_output_video(output_path, crops, fps=30.0)
+        
+        # Windows outside the frame are clamped, not rejected: each one is a full-size crop
+        width, height = size
+        process, = fake_ffmpeg
+        assert process.cmd[process.cmd.index('-s') + 1] == f'{width}x{height}'
+        assert process.stdin.chunks == [bytes(width * height * 3)] * 10
+        assert process.stdin.closed
+        assert os.path.getsize(output_path) > 0
+
+
+class TestFFmpegWriter:
+    """Test encoding through the ffmpeg subprocess."""
+    
+    def test_command_line(self, vpmod):
+        """Test the ffmpeg command for raw BGR frames on stdin."""
+        processor = vpmod.VideoProcessor()
+        processor.video_info = {'path': 'input.mp4'}
+        
+        with patch('video_processor.subprocess.Popen') as mock_popen, \
+             patch('video_processor.get_ffmpeg_path', return_value='ffmpeg'):
+            process = processor._open_ffmpeg_writer('output.mp4', 960, 540, 30.0)
+        
+        assert process is mock_popen.return_value
+        cmd = mock_popen.call_args.args[0]
+        assert mock_popen.call_args.kwargs == {'stdin': subprocess.PIPE}
+        assert cmd[0] == 'ffmpeg'
+        assert cmd[-1] == 'output.mp4'
+        
+        # Raw input options come before the stdin input, encoder options after
+        pipe = cmd.index('pipe:0')
+        assert cmd[cmd.index('-f') + 1] == 'rawvideo'
+        assert cmd[cmd.index('-s') + 1] == '960x540'
+        assert cmd[cmd.index('-r') + 1] == '30.0'
+        assert cmd[cmd.index('-pix_fmt') + 1] == 'bgr24' and cmd.index('-pix_fmt') < pipe
+        assert cmd[pipe + 1:pipe + 3] == ['-i', 'input.mp4']
+        assert cmd[cmd.index('-c:v') + 1] == 'libx264'
+        assert cmd[cmd.index('-pix_fmt', pipe) + 1] == 'yuv420p'
+        # Audio never shortens the video, and without a duration nothing is cut
+        assert '-shortest' not in cmd and '-t' not in cmd
+    
+    def test_command_line_duration(self, vpmod):
+        """Test that the output is cut at the video's duration, not the audio's."""
+        processor = vpmod.VideoProcessor()
+        processor.video_info = {'path': 'input.mp4'}
         
-        # Verify frames were written
-        assert mock_writer.write.call_count == 100
+        with patch('video_processor.subprocess.Popen') as mock_popen, \
+             patch('video_processor.get_ffmpeg_path', return_value='ffmpeg'):
+            processor._open_ffmpeg_writer('output.mp4', 960, 540, 30.0, duration=10.0)
         
-        # Verify writer was released
-        mock_writer.release.assert_called_once()
+        cmd = mock_popen.call_args.args[0]
+        assert cmd[-3:] == ['-t', '10.0', 'output.mp4']
     
-    @patch('video_processor.cv2.VideoCapture')
-    @patch('video_processor.cv2.VideoWriter')
-    def test_generate_output_video_writer_failure(self, mock_video_writer, mock_video_capture):
-        """Test output video generation when writer fails to open."""
-        # Create mock video capture
-        mock_cap = Mock()
-        mock_cap.isOpened.return_value = True
-        mock_cap.get.side_effect = lambda prop: {
-            cv2.CAP_PROP_FRAME_COUNT: 100,
-            cv2.CAP_PROP_FPS: 30.0,
-            cv2.CAP_PROP_FRAME_WIDTH: 1920,
-            cv2.CAP_PROP_FRAME_HEIGHT: 1080
-        }.get(prop, 0)
-        
-        mock_video_capture.return_value = mock_cap
-        
-        # Create mock video writer that fails to open
-        mock_writer = Mock()
-        mock_writer.isOpened.return_value = False
-        mock_video_writer.return_value = mock_writer
+    def test_frames_written_to_stdin(self, fake_ffmpeg, encoding_processor, tmp_path):
+        """Test that every cropped frame is piped to ffmpeg, in order."""
+        processor, frames = encoding_processor
+        output_path = str(tmp_path / 'output.mp4')
+        
+        processor.generate_output_video(output_path, [[8, 8, 32, 16]] * 4, fps=30.0)
+        
+        process, = fake_ffmpeg
+        assert process.cmd[process.cmd.index('-t') + 1] == str(4 / 30.0)
+        assert process.stdin.chunks == [frame[8:24, 8:40].tobytes() for frame in frames]
+        assert process.stdin.closed
+        assert os.path.exists(output_path)
+    
+    def test_odd_crop_sizes_rounded_to_even(self, fake_ffmpeg, encoding_processor, tmp_path):
+        """Test that odd crop sizes are trimmed to even ones, keeping yuv420p."""
+        processor, frames = encoding_processor
         
-        # Create processor and load video
-        processor = VideoProcessor()
-        processor.load_video('test_video.mp4')
+        processor.generate_output_video(str(tmp_path / 'output.mp4'), [[3, 5, 33, 17]] * 4, fps=30.0)
         
-        # Create crop windows
-        crop_windows = [[480, 270, 960, 540]] * 100
+        process, = fake_ffmpeg
+        assert process.cmd[process.cmd.index('-s') + 1] == '32x16'
+        assert process.cmd[process.cmd.index('pipe:0'):].count('yuv420p') == 1
+        assert process.stdin.chunks == [frame[5:21, 3:35].tobytes() for frame in frames]
+    
+    def test_frames_cropped_in_batches(self, fake_ffmpeg, encoding_processor, tmp_path, monkeypatch, vpmod):
+        """Test that the output frames are cropped through apply_crop_batch, CROP_BATCH_SIZE at a time."""
+        processor, frames = encoding_processor
+        monkeypatch.setattr(vpmod, 'CROP_BATCH_SIZE', 3)
+        
+        with patch.object(processor, 'apply_crop_batch', wraps=processor.apply_crop_batch) as mock_batch:
+            processor.generate_output_video(str(tmp_path / 'output.mp4'), [[8, 8, 32, 16]] * 4, fps=30.0)
+        
+        assert [len(call.args[0]) for call in mock_batch.call_args_list] == [3, 1]
+        process, = fake_ffmpeg
+        assert process.stdin.chunks == [frame[8:24, 8:40].tobytes() for frame in frames]
+        
+        # release() shuts the crop thread pool down
+        executor = processor._crop_executor
+        processor.release()
+        assert processor._crop_executor is None
+        with pytest.raises(RuntimeError):
+            executor.submit(int)
+    
+    def test_output_size_from_clamped_window(self, fake_ffmpeg, encoding_processor, tmp_path):
+        """Test that the output size comes from the first window after clamping, not before."""
+        processor, frames = encoding_processor
         
-        # Test that exception is raised
-        with pytest.raises(ValueError, match="Could not open output video file"):
-            processor.generate_output_video(
-                output_path='test_output.mp4',
-                crop_windows=crop_windows,
-                fps=30.0
-            )
+        # Wider than the 64x48 frame and odd: clamped to 64x41, then evened to 64x40
+        processor.generate_output_video(str(tmp_path / 'output.mp4'), [[-8, 0, 100, 41]] * 4, fps=30.0)
+        
+        process, = fake_ffmpeg
+        assert process.cmd[process.cmd.index('-s') + 1] == '64x40'
+        assert process.stdin.chunks == [frame[0:40, 0:64].tobytes() for frame in frames]
     
-    @patch('video_processor.cv2.VideoCapture')
-    @patch('video_processor.cv2.VideoWriter')
-    def test_generate_output_video_crop_validation(self, mock_video_writer, mock_video_capture):
-        """Test crop window validation in output generation."""
-        # Create mock video capture
-        mock_cap = Mock()
-        mock_cap.isOpened.return_value = True
-        mock_cap.get.side_effect = lambda prop: {
-            cv2.CAP_PROP_FRAME_COUNT: 100,
-            cv2.CAP_PROP_FPS: 30.0,
-            cv2.CAP_PROP_FRAME_WIDTH: 1920,
-            cv2.CAP_PROP_FRAME_HEIGHT: 1080
-        }.get(prop, 0)
-        
-        mock_video_capture.return_value = mock_cap
-        
-        # Create mock video writer
-        mock_writer = Mock()
-        mock_writer.isOpened.return_value = True
-        mock_video_writer.return_value = mock_writer
+    def test_nonzero_return_code_raises(self, fake_ffmpeg, encoding_processor, tmp_path, monkeypatch):
+        """Test that an ffmpeg failure is raised and the partial output removed."""
+        processor, _ = encoding_processor
+        output_path = str(tmp_path / 'output.mp4')
+        monkeypatch.setattr(_FakeFFmpeg, 'returncode', 1)
         
-        # Create processor and load video
-        processor = VideoProcessor()
-        processor.load_video('test_video.mp4')
+        with pytest.raises(RuntimeError, match="FFmpeg exited with code 1"):
+            processor.generate_output_video(output_path, [[8, 8, 32, 16]] * 4, fps=30.0)
         
-        # Test with invalid crop window (negative coordinates)
-        invalid_crop_windows = [[-10, -10, 100, 100]] * 100
+        assert not os.path.exists(output_path)
+    
+    def test_process_killed_on_error(self, fake_ffmpeg, encoding_processor, tmp_path):
+        """Test that ffmpeg is killed when processing fails mid-stream."""
+        processor, frames = encoding_processor
+        output_path = str(tmp_path / 'output.mp4')
+        processor.cap.read.side_effect = [(True, frames[0]), RuntimeError("decode failed")]
+        
+        with pytest.raises(RuntimeError, match="decode failed"):
+            processor.generate_output_video(output_path, [[8, 8, 32, 16]] * 4, fps=30.0)
+        
+        process, = fake_ffmpeg
+        assert process.killed
+        assert not os.path.exists(output_path)
+    
+    def test_worker_error_reaches_caller(self, fake_ffmpeg, encoding_processor, tmp_path, monkeypatch):
+        """Test that a failed pipe write on the watermark worker is raised by generate_output_video."""
+        processor, _ = encoding_processor
+        output_path = str(tmp_path / 'output.mp4')
+        
+        def broken_pipe(self, data):
+            raise BrokenPipeError("ffmpeg went away")
+        monkeypatch.setattr(_FakeStdin, 'write', broken_pipe)
+        
+        with pytest.raises(BrokenPipeError, match="ffmpeg went away"):
+            processor.generate_output_video(output_path, [[8, 8, 32, 16]] * 4, fps=30.0)
+        
+        process, = fake_ffmpeg
+        assert process.killed
+        assert not os.path.exists(output_path)
+        # The worker thread was stopped, not left running
+        assert not any(type(t).__name__ == 'WatermarkWorker' for t in threading.enumerate())
+
+
+class TestClampCropWindows:
+    """Test vectorized crop window clamping."""
+    
+    def test_clamp_inside_frame_unchanged(self, vpmod):
+        """Test that windows already inside the frame are left as-is."""
+        crops = vpmod.clamp_crop_windows([[480, 270, 960, 540]] * 3, 1920, 1080)
         
-        with pytest.raises(ValueError, match="Invalid crop window"):
-            processor.generate_output_video(
-                output_path='test_output.mp4',
-                crop_windows=invalid_crop_windows,
-                fps=30.0
-            )
+        assert crops.shape == (3, 4)
+        assert crops.tolist() == [[480, 270, 960, 540]] * 3
+    
+    def test_clamp_shifts_overhanging_windows(self, vpmod):
+        """Test that windows overhanging an edge are shifted back inside."""
+        crops = vpmod.clamp_crop_windows([[-10, -10, 100, 100], [1900, 1000, 100, 100]], 1920, 1080)
         
-        # Test with invalid crop window (out of bounds)
-        out_of_bounds_crop_windows = [[2000, 2000, 100, 100]] * 100
+        assert crops.tolist() == [[0, 0, 100, 100], [1820, 980, 100, 100]]
+    
+    def test_clamp_shrinks_oversized_windows(self, vpmod):
+        """Test that windows larger than the frame are shrunk to fit."""
+        crops = vpmod.clamp_crop_windows([[50, 50, 4000, 2000]], 1920, 1080)
         
-        with pytest.raises(ValueError, match="Crop window out of bounds"):
-            processor.generate_output_video(
-                output_path='test_output.mp4',
-                crop_windows=out_of_bounds_crop_windows,
-                fps=30.0
-            )
+        assert crops.tolist() == [[0, 0, 1920, 1080]]
 
 
+
+class TestVideoProcessorCrop:
+    """Test frame cropping."""
+    
+    @pytest.mark.parametrize("crop_window, expected", [
+        ([10, 20, 30, 40], (20, 10, 40, 30)),         # Inside the frame: (y, x, h, w)
+        ([-50, -50, 30, 40], (0, 0, 40, 30)),         # Negative position
+        ([100, 50, 500, 500], (50, 100, 22, 28)),     # Overhanging the bottom-right edge
+        ([1000, 2000, -100, -200], (71, 127, 1, 1)),  # Off-frame with negative size
+    ])
+    def test_apply_crop_clips_to_frame(self, crop_window, expected, vpmod):
+        """Test that crop windows are clipped to a non-empty region of the frame."""
+        processor = vpmod.VideoProcessor()
+        frame = np.arange(72 * 128, dtype=np.int32).reshape(72, 128, 1).repeat(3, axis=2)
+        
+        crop = processor.apply_crop(frame, crop_window)
+        
+        y, x, h, w = expected
+        assert crop.shape == (h, w, 3)
+        assert crop[0, 0, 0] == frame[y, x, 0]
+    
+    def test_apply_crop_batch(self, vpmod):
+        """Test that a batch of frames is cropped in order into contiguous arrays."""
+        processor = vpmod.VideoProcessor()
+        frames = [np.full((72, 128, 3), i, dtype=np.uint8) for i in range(32)]
+        windows = [[i, 4, 40, 64] for i in range(32)]
+        
+        crops = processor.apply_crop_batch(frames, windows)
+        
+        assert len(crops) == 32
+        for i, crop in enumerate(crops):
+            assert crop.shape == (64, 40, 3)
+            assert crop.flags['C_CONTIGUOUS']
+            assert (crop == i).all()
+        
+        # The thread pool is created once and reused; each call returns its own frames
+        executor = processor._crop_executor
+        later = processor.apply_crop_batch(frames[2:4], windows[2:4])
+        assert processor._crop_executor is executor
+        assert (crops[0] == 0).all() and (crops[1] == 1).all()
+        assert not np.shares_memory(crops[0], later[0])
+        assert not any(np.shares_memory(crop, frame) for crop, frame in zip(crops, frames))
+    
+    def test_apply_crop_batch_mixed_sizes(self, vpmod):
+        """Test that crops of different sizes are each copied out on their own."""
+        processor = vpmod.VideoProcessor()
+        frames = [np.zeros((72, 128, 3), dtype=np.uint8)] * 2
+        
+        crops = processor.apply_crop_batch(frames, [[0, 0, 128, 64], [0, 0, 20, 32]])
+        
+        assert [crop.shape for crop in crops] == [(64, 128, 3), (32, 20, 3)]
+        # Full-width crops are contiguous views of the frame, but are still copied
+        assert all(crop.flags['C_CONTIGUOUS'] for crop in crops)
+        assert not any(np.shares_memory(crop, frames[0]) for crop in crops)
+
 class TestVideoProcessorCleanup:
-    """Test cleanup functionality."""
+    """Test releasing the processor's resources."""
     
-    @patch('video_processor.cv2.VideoCapture')
-    def test_cleanup(self, mock_video_capture):
-        """Test cleanup of video processor."""
-        # Create mock video capture
-        mock_cap = Mock()
-        mock_cap.isOpened.return_value = True
-        mock_cap.get.side_effect = lambda prop: {
-            cv2.CAP_PROP_FRAME_COUNT: 100,
-            cv2.CAP_PROP_FPS: 30.0,
-            cv2.CAP_PROP_FRAME_WIDTH: 640,
-            cv2.CAP_PROP_FRAME_HEIGHT: 480
-        }.get(prop, 0)
-        
-        mock_video_capture.return_value = mock_cap
+    def test_release(self, mocked_video_capture, vpmod):
+        """Test that release() frees the capture and the crop thread pool."""
+        _, mock_cap = mocked_video_capture
         
-        # Create processor and load video
-        processor = VideoProcessor()
+        # Create processor, load video and start the crop thread pool
+        processor = vpmod.VideoProcessor()
         processor.load_video('test_video.mp4')
+        processor.apply_crop_batch([np.zeros((4, 4, 3), dtype=np.uint8)], [[0, 0, 2, 2]])
+        executor = processor._crop_executor
         
-        # Verify cap is set
-        assert processor.cap is not None
+        processor.release()
         
-        # Cleanup
-        processor.cleanup()
-        
-        # Verify cap was released
+        # Verify cap was released and the pool shut down
         mock_cap.release.assert_called_once()
         assert processor.cap is None
+        assert processor._crop_executor is None
+        with pytest.raises(RuntimeError):
+            executor.submit(int)
+        
+        # Releasing again is harmless
+        processor.release()
+        mock_cap.release.assert_called_once()
     
-    def test_cleanup_no_cap(self):
-        """Test cleanup when no video is loaded."""
-        processor = VideoProcessor()
+    def test_release_no_cap(self, vpmod):
+        """Test release when no video is loaded."""
+        processor = vpmod.VideoProcessor()
         
-        # Cleanup should not crash
-        processor.cleanup()
+        # Release should not crash
+        processor.release()
         assert processor.cap is None
+    
+    def test_del_releases_capture(self, mocked_video_capture, vpmod):
+        """Test that a processor that is garbage collected releases its capture."""
+        _, mock_cap = mocked_video_capture
+        
+        processor = vpmod.VideoProcessor()
+        processor.load_video('test_video.mp4')
+        del processor
+        
+        mock_cap.release.assert_called_once()
 
 
 class TestVideoProcessorIntegration:
@@ -337,20 +642,17 @@ class TestVideoProcessorIntegration:
     
     @pytest.mark.integration
     @pytest.mark.requires_video
-    def test_full_video_processing(self, sample_video_path, output_dir):
+    def test_full_video_processing(self, tiny_clip, output_dir, vpmod):
         """Test full video processing pipeline."""
-        if not sample_video_path:
-            pytest.skip("Sample video not available")
-        
         # Create output path
         output_path = os.path.join(output_dir, "test_output.mp4")
         
         # Create processor
-        processor = VideoProcessor()
+        processor = vpmod.VideoProcessor()
         
         try:
             # Load video
-            video_info = processor.load_video(sample_video_path)
+            video_info = processor.load_video(tiny_clip)
             
             # Verify video info
             assert video_info['total_frames'] > 0
@@ -0,0 +1,89 @@
+"""
+Tests for the watermark.py module.
+"""
+
+import threading
+import pytest
+from unittest.mock import Mock
+
+# Import the watermark worker
+from watermark import WatermarkWorker
+
+
+@pytest.fixture
+def passthrough_renderer():
+    """A renderer that hands every frame back unchanged."""
+    renderer = Mock()
+    renderer.apply_watermark.side_effect = lambda frame, inplace: frame
+    return renderer
+
+
+class TestWatermarkWorker:
+    """Test the background watermark/encode worker."""
+    
+    def test_frames_reach_sink_in_order(self, passthrough_renderer):
+        """Test that frames are watermarked in place and passed on in submission order."""
+        received = []
+        worker = WatermarkWorker(received.append, renderer=passthrough_renderer, maxsize=2)
+        worker.start()
+        
+        for frame in range(50):
+            worker.submit(frame)
+        worker.close()
+        
+        assert received == list(range(50))
+        passthrough_renderer.apply_watermark.assert_called_with(49, inplace=True)
+    
+    def test_stop_drains_queue_and_joins(self, passthrough_renderer):
+        """Test that stop() waits for every queued frame before the thread exits."""
+        received = []
+        release = threading.Event()
+        
+        def slow_sink(frame):
+            release.wait()
+            received.append(frame)
+        
+        worker = WatermarkWorker(slow_sink, renderer=passthrough_renderer, maxsize=8)
+        worker.start()
+        for frame in range(5):
+            worker.submit(frame)
+        
+        release.set()
+        worker.stop()
+        
+        assert received == list(range(5))
+        assert not worker.is_alive()
+    
+    def test_sink_error_raised_by_close(self, passthrough_renderer):
+        """Test that an error in the sink is re-raised to the caller on close()."""
+        def failing_sink(frame):
+            raise BrokenPipeError("ffmpeg went away")
+        
+        worker = WatermarkWorker(failing_sink, renderer=passthrough_renderer, maxsize=2)
+        worker.start()
+        worker.submit(0)
+        
+        with pytest.raises(BrokenPipeError, match="ffmpeg went away"):
+            worker.close()
+        assert not worker.is_alive()
+    
+    def test_error_keeps_draining_so_submit_never_blocks(self, passthrough_renderer):
+        """Test that after an error the worker keeps draining, and submit() re-raises it."""
+        handled = []
+        
+        def failing_sink(frame):
+            handled.append(frame)
+            raise ValueError("bad frame")
+        
+        worker = WatermarkWorker(failing_sink, renderer=passthrough_renderer, maxsize=1)
+        worker.start()
+        
+        # Far more frames than the queue holds; this would hang if the worker stopped reading
+        with pytest.raises(ValueError, match="bad frame"):
+            for frame in range(100):
+                worker.submit(frame)
+        
+        worker.stop()
+        assert not worker.is_alive()
+        # Only the first frame reached the sink, the rest were discarded
+        assert handled == [0]